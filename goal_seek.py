@@ -0,0 +1,363 @@
+import logging
+
+import numpy as np
+
+import inputs
+import main as runner
+from main import invalidated_rules
+from rules import lab_budgets, projections
+from rules.money import to_centimes, to_francs
+from rules.periods import LedgerIndex
+from settings import cohorts as cohorts_settings
+from settings import indexation as indexation_settings
+from settings import main as settings
+
+logger = logging.getLogger(__name__)
+
+METHODS = ["linear", "bisection"]
+
+
+class GoalSeekError(ValueError):
+    """
+    Raised when the goal seek can't be set up from the given parameters, bounds and target
+    """
+
+
+def __get_settings_modules():
+    """
+    Returns the settings modules the free parameters can be taken from, with the stages using them.
+    The indexation settings are used by the metric only.
+
+    returns:
+        (dict): the settings module and the stages using it, by name
+    """
+    return_value = {
+        name: (inputs.RULES[name].settings, [name]) for name in runner.RULES
+    }
+    return_value["main"] = (settings, list(runner.RULES))
+    return_value["cohorts"] = (cohorts_settings, ["lab_budgets"])
+    return_value["indexation"] = (indexation_settings, [])
+    return return_value
+
+
+def find_parameter(name):
+    """
+    Finds the setting of a free parameter.
+
+    parameters:
+        name (str): the name of the setting, optionally prefixed by the name of its settings module
+            (e.g. "lab_budgets.PO_YEARLY_BUDGET")
+
+    returns:
+        (module): the settings module holding the setting
+        (str): the name of the setting
+        (list): the stages to run again when it changes
+    """
+    modules = __get_settings_modules()
+    module_name, _, attribute = name.rpartition(".")
+    if module_name:
+        if module_name not in modules or not hasattr(
+            modules[module_name][0], attribute
+        ):
+            raise GoalSeekError("Unknown parameter: {}".format(name))
+        return modules[module_name][0], attribute, modules[module_name][1]
+
+    found = [
+        (module, attribute, stages)
+        for module, stages in modules.values()
+        if hasattr(module, attribute)
+    ]
+    if not found:
+        raise GoalSeekError("Unknown parameter: {}".format(name))
+    if len(found) > 1:
+        raise GoalSeekError(
+            "Several settings are named {}, prefix it with the name of its settings module".format(
+                name
+            )
+        )
+    return found[0]
+
+
+class GoalSeek(object):
+    """
+    Finds the values of free parameters giving a yearly total of the budgets.
+
+    The inputs are loaded once. Every evaluation sets the parameters in the settings, runs again the
+    rules using them (and the rules depending on them) on a ledger keeping the periods of the other
+    rules, then restores the settings. The milestones of the lab budgets are calculated once for
+    every value of the milestone settings (see lab_budgets.MILESTONE_SETTINGS), and nothing is
+    dumped to file.
+    """
+
+    def __init__(
+        self, year, CFs=None, units=None, rules=None, real=False, loaded_inputs=None
+    ):
+        """
+        parameters:
+            year (int): the year of the total
+            CFs (list): optional, only the budgets of these CFs are part of the total
+            units (list): optional, only the budgets of the CFs of these units are part of the total
+            rules (list): optional, only the budgets of these rules (e.g. "lab budgets") are part of the total
+            real (bool): whether the total is made of the real budgets instead of the nominal ones.
+                Only meaningful when the budgets are indexed (see settings.indexation).
+            loaded_inputs (dict): optional, the inputs as returned by inputs.load_all
+        """
+        super().__init__()
+
+        self.year = year
+        self.CFs = None if CFs is None else [str(CF) for CF in CFs]
+        self.units = units
+        self.rules = rules
+        self.real = real
+        self.loaded_inputs = (
+            inputs.load_all() if loaded_inputs is None else loaded_inputs
+        )
+
+        self.ledger = LedgerIndex()
+        self.evaluations = 0
+        self.__milestones = {}
+        self.__metrics = {}
+        # the stages whose periods were calculated with other values than the settings
+        self.__modified_stages = set()
+
+        self.__run(runner.get_params(), runner.RULES)
+
+    def __run(self, params, rules):
+        """
+        Runs the rules, reusing the milestones calculated before for the same milestone settings
+        """
+        key = tuple(
+            getattr(lab_budgets.settings, name)
+            for name in lab_budgets.MILESTONE_SETTINGS
+        )
+        params["milestones"] = self.__milestones.get(key)
+        milestones = runner.run_rules(
+            params, self.loaded_inputs, self.ledger, names=rules, dump_milestones=False
+        )
+        if milestones is not None:
+            self.__milestones[key] = milestones
+
+    def __metric(self, params):
+        """
+        Returns the yearly total of the budgets in the ledger, in centimes
+        """
+        periods = self.ledger.periods()
+        if self.rules is not None:
+            periods = periods.loc[periods["rule"].isin(self.rules)]
+        if self.CFs is not None:
+            periods = periods.loc[periods["CF"].astype(str).isin(self.CFs)]
+        if self.units is not None:
+            if self.loaded_inputs["projections"] is None:
+                raise GoalSeekError(
+                    "The units of the CFs are unknown, see settings.projections"
+                )
+            units = periods["CF"].map(self.loaded_inputs["projections"])
+            periods = periods.loc[units.isin(self.units)]
+
+        projection = projections.Projection(
+            periods, indexation=params.get("indexation")
+        )
+        monthly = projection.real_monthly if self.real else projection.monthly
+        if monthly is None:
+            raise GoalSeekError(
+                "The real budgets require the indexation of the budgets"
+            )
+        in_year = np.asarray(projection.dates.year == self.year)
+        return int(monthly[:, in_year].sum())
+
+    def evaluate(self, parameters):
+        """
+        Returns the yearly total for the given values of the free parameters.
+
+        parameters:
+            parameters (dict): the value of each free parameter, by name (see find_parameter)
+
+        returns:
+            (int): the yearly total in centimes
+        """
+        key = tuple(sorted(parameters.items()))
+        if key in self.__metrics:
+            return self.__metrics[key]
+
+        found = [find_parameter(name) for name in parameters]
+        previous = [getattr(module, attribute) for module, attribute, _ in found]
+        stages = set()
+        try:
+            for (module, attribute, parameter_stages), value in zip(
+                found, parameters.values()
+            ):
+                setattr(module, attribute, value)
+                stages.update(parameter_stages)
+
+            # the stages modified by the previous evaluation run again with the settings.
+            # They stay modified until the run succeeds, the ledger may hold some of them.
+            rules = invalidated_rules(stages | self.__modified_stages)
+            self.__modified_stages = set(rules)
+            params = runner.get_params()
+            self.__run(params, rules)
+            self.__modified_stages = set(invalidated_rules(stages))
+            metric = self.__metric(params)
+        finally:
+            for (module, attribute, _), value in zip(found, previous):
+                setattr(module, attribute, value)
+
+        self.evaluations += 1
+        self.__metrics[key] = metric
+        logger.debug(
+            "{}: {:.2f}".format(
+                ", ".join("{}={}".format(name, value) for name, value in key),
+                to_francs(metric),
+            )
+        )
+        return metric
+
+    def solve(
+        self, target, parameters, method="linear", tolerance=1.0, max_evaluations=50
+    ):
+        """
+        Finds the values of the free parameters giving the target yearly total.
+
+        All the free parameters move together, from their lower to their upper bounds, so that the
+        search is along a single position between 0 (the lower bounds) and 1 (the upper bounds).
+        The bounds must bracket the target. Integer bounds give integer values (e.g. periods in months).
+        A GoalSeekError is raised when the parameters, their bounds or the target can't be used.
+
+        parameters:
+            target (float): the target yearly total, in francs
+            parameters (dict): the (lower, upper) bounds of each free parameter, by name
+            method (str): "bisection" halves the bracket at every step, "linear" interpolates the
+                total linearly between the ends of the bracket (false position), which only takes
+                a few evaluations when the total is about linear in the parameters (e.g. budgets)
+            tolerance (float): the largest accepted difference with the target, in francs
+            max_evaluations (int): the largest number of evaluations of the bracket
+
+        returns:
+            (dict): the solution
+                solution['parameters'] (dict): the value of each free parameter. When the target
+                    can't be reached within the tolerance (e.g. integer parameters), the values of
+                    the final bracket whose total does not exceed the target.
+                solution['total'] (float): the yearly total for these values, in francs
+                solution['converged'] (bool): whether the total is within the tolerance of the target
+                solution['evaluations'] (int): the number of evaluations of the simulation
+        """
+        if method not in METHODS:
+            raise GoalSeekError("Unknown method: {}".format(method))
+        if not parameters:
+            raise GoalSeekError("At least one free parameter is required")
+        for name, bounds in parameters.items():
+            find_parameter(name)
+            if len(bounds) != 2 or not all(
+                isinstance(bound, (int, float, np.number)) for bound in bounds
+            ):
+                raise GoalSeekError(
+                    "The bounds of {} must be a lower and an upper number".format(name)
+                )
+
+        target = to_centimes(target)
+        tolerance = to_centimes(tolerance)
+        bounds = dict(parameters)
+
+        def values_at(position):
+            return_value = {}
+            for name, (lower, upper) in bounds.items():
+                value = float(lower + position * (upper - lower))
+                if isinstance(lower, (int, np.integer)) and isinstance(
+                    upper, (int, np.integer)
+                ):
+                    value = int(round(value))
+                return_value[name] = value
+            return return_value
+
+        def gap_at(position):
+            return self.evaluate(values_at(position)) - target
+
+        evaluations = self.evaluations
+        low, high = 0.0, 1.0
+        low_gap, high_gap = gap_at(low), gap_at(high)
+        if np.sign(low_gap) == np.sign(high_gap) and low_gap != 0:
+            raise GoalSeekError(
+                "The target {:.2f} is not between the totals {:.2f} and {:.2f} of the bounds".format(
+                    to_francs(target),
+                    to_francs(low_gap + target),
+                    to_francs(high_gap + target),
+                )
+            )
+
+        # the interpolated gaps get halved when the same end is kept twice (Illinois algorithm)
+        low_weight, high_weight = low_gap, high_gap
+        kept = None
+        best = low if abs(low_gap) <= abs(high_gap) else high
+        while (
+            abs(gap_at(best)) > tolerance
+            and self.evaluations - evaluations < max_evaluations
+        ):
+            position = (low + high) / 2
+            if method == "linear":
+                position = (low * high_weight - high * low_weight) / (
+                    high_weight - low_weight
+                )
+            # integer values: when the position falls on an end of the bracket, try the middle
+            if values_at(position) in (values_at(low), values_at(high)):
+                position = (low + high) / 2
+                if values_at(position) in (values_at(low), values_at(high)):
+                    break
+
+            gap = gap_at(position)
+            if np.sign(gap) == np.sign(low_gap):
+                low, low_gap, low_weight = position, gap, gap
+                if kept == "low":
+                    high_weight /= 2
+                kept = "low"
+            else:
+                high, high_gap, high_weight = position, gap, gap
+                if kept == "high":
+                    low_weight /= 2
+                kept = "high"
+            best = position
+
+        converged = abs(gap_at(best)) <= tolerance
+        if not converged:
+            best = low if low_gap <= 0 else high
+
+        return {
+            "parameters": values_at(best),
+            "total": float(to_francs(gap_at(best) + target)),
+            "converged": bool(converged),
+            "evaluations": self.evaluations - evaluations,
+        }
+
+
+def main(
+    year,
+    target,
+    parameters,
+    CFs=None,
+    units=None,
+    rules=None,
+    real=False,
+    method="linear",
+    tolerance=1.0,
+):
+    """
+    Finds the values of the free parameters giving the target yearly total, and prints them.
+    See GoalSeek.solve for the parameters.
+    """
+    logger.info("Started the goal seek")
+
+    goal_seek = GoalSeek(year, CFs=CFs, units=units, rules=rules, real=real)
+    solution = goal_seek.solve(target, parameters, method=method, tolerance=tolerance)
+
+    for name, value in solution["parameters"].items():
+        print("{} = {}".format(name, value))
+    print(
+        "{} total: {:.2f} (target: {:.2f}, {} evaluations{})".format(
+            year,
+            solution["total"],
+            target,
+            solution["evaluations"],
+            "" if solution["converged"] else ", not within the tolerance",
+        )
+    )
+
+    logger.info("done")
+    return solution
@@ -0,0 +1,97 @@
+import concurrent.futures
+import logging
+import os
+
+from rules import (
+    adjustments,
+    lab_budgets,
+    lab_negotiated_budgets,
+    non_lab_budgets,
+    projections,
+)
+
+logger = logging.getLogger(__name__)
+
+# The rules (and other stages) reading input files, by the name used as key of the loaded inputs
+RULES = {
+    "lab_budgets": lab_budgets,
+    "lab_negotiated_budgets": lab_negotiated_budgets,
+    "adjustments": adjustments,
+    "non_lab_budgets": non_lab_budgets,
+    "projections": projections,
+}
+
+# The stages that can run without their input files: their inputs are None when a file is missing
+OPTIONAL = ["projections"]
+
+
+def resolve_sources(names=None):
+    """
+    Returns the files read by each rule, failing early if one of them is missing
+    (except for the OPTIONAL stages).
+
+    parameters:
+        names (list): the rules to resolve the sources of. Defaults to all the rules.
+
+    returns:
+        (dict): the list of absolute file paths read by each rule
+    """
+    if names is None:
+        names = list(RULES.keys())
+
+    return_value = {}
+    for name in names:
+        return_value[name] = [
+            os.path.realpath(path) for path in RULES[name].input_files()
+        ]
+        for path in return_value[name]:
+            logger.debug("{} reads {}".format(name, path))
+            if not os.path.isfile(path) and name not in OPTIONAL:
+                raise FileNotFoundError(
+                    "Input file of {} not found: {}".format(name, path)
+                )
+    return return_value
+
+
+def load_all(names=None, max_workers=None, use_processes=False):
+    """
+    Reads and parses the inputs of the rules concurrently, so the waits on the files overlap.
+    The input files are small, so a thread pool is used by default: starting worker processes
+    takes longer than parsing them.
+
+    parameters:
+        names (list): the rules to load the inputs of. Defaults to all the rules.
+        max_workers (int): the size of the pool. Defaults to one worker per rule.
+        use_processes (bool): whether to parse in a process pool instead of a thread pool,
+            only worth it for large input files
+
+    returns:
+        (dict): the parsed inputs of each rule, to be given to the rule's main as params["inputs"]
+    """
+    sources = resolve_sources(names)
+    logger.info("Loading the inputs of {} rules".format(len(sources)))
+
+    missing = [
+        name
+        for name, paths in sources.items()
+        if not all(os.path.isfile(path) for path in paths)
+    ]
+    for name in missing:
+        logger.warning("Input files of {} not found, running without them".format(name))
+
+    if use_processes:
+        executor_class = concurrent.futures.ProcessPoolExecutor
+    else:
+        executor_class = concurrent.futures.ThreadPoolExecutor
+
+    with executor_class(max_workers=max_workers or len(sources)) as executor:
+        futures = {
+            name: executor.submit(RULES[name].load_inputs)
+            for name in sources.keys()
+            if name not in missing
+        }
+        return_value = {name: future.result() for name, future in futures.items()}
+    return_value.update({name: None for name in missing})
+
+    logger.info("done")
+    return return_value
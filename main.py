@@ -1,14 +1,55 @@
+import argparse
 import logging
 import math
+import os
 
 import numpy as np
 import pandas as pd
 
-from rules import adjustments, lab_budgets, lab_negotiated_budgets, non_lab_budgets
+import inputs
+from rules import (
+    adjustments,
+    lab_budgets,
+    lab_negotiated_budgets,
+    non_lab_budgets,
+    projections,
+)
+from rules.indexation import Indexation
+from rules.money import to_francs
+from rules.periods import LedgerIndex, expand_periods, month_index
+from settings import cohorts as cohorts_settings
+from settings import indexation as indexation_settings
 from settings import main as settings
 
 logger = logging.getLogger(__name__)
 
+# The rules in the order they run, and the rules whose results each of them needs
+RULES = ["lab_budgets", "lab_negotiated_budgets", "adjustments", "non_lab_budgets"]
+DEPENDENCIES = {"lab_negotiated_budgets": ["lab_budgets"]}
+
+
+def invalidated_rules(stages):
+    """
+    Returns the rules to run again when some stages are invalidated: the invalidated rules and
+    every rule depending on them, directly or not, in the order they have to run.
+
+    parameters:
+        stages (iterable): the invalidated stages
+
+    returns:
+        (list): the rules to run again
+    """
+    invalidated = set(stages)
+    changed = True
+    while changed:
+        changed = False
+        for rule, dependencies in DEPENDENCIES.items():
+            if rule not in invalidated and invalidated.intersection(dependencies):
+                invalidated.add(rule)
+                changed = True
+
+    return [rule for rule in RULES if rule in invalidated]
+
 
 def __dump_output(df):
     logger.info("Dumping output to file")
@@ -17,87 +58,381 @@ def __dump_output(df):
     logger.info("done")
 
 
+def __get_rule_output_file(name):
+    """
+    Returns the path of the file of the monthly ledger lines of a rule, next to settings.OUTPUT_FILE
+    """
+    root, extension = os.path.splitext(settings.OUTPUT_FILE)
+    return "{}_{}{}".format(root, name, extension)
+
+
 def __dump_milestones(milestones):
     df = pd.DataFrame(milestones)
     df.to_excel(settings.MILESTONES_OUTPUT_FILE, index=False)
 
 
-def __final_cleanup(df):
+def __dump_projections(projection):
+    logger.info("Dumping projections to file")
+    logger.debug("file path: {}".format(projections.settings.PROJECTIONS_OUTPUT_FILE))
+    school = projection.school()
+    amounts = school.columns.drop("date")
+    school[amounts] = to_francs(school[amounts])
+    with pd.ExcelWriter(projections.settings.PROJECTIONS_OUTPUT_FILE) as writer:
+        school.to_excel(writer, sheet_name="school", index=False)
+        # the units are optional, see projections.load_inputs
+        if projection.units is not None:
+            to_francs(projection.by_unit()).to_excel(writer, sheet_name="units")
+        to_francs(projection.by_CF()).to_excel(writer, sheet_name="CFs")
+        if projection.real_monthly is not None:
+            if projection.units is not None:
+                to_francs(projection.by_unit(real=True)).to_excel(
+                    writer, sheet_name="units (real)"
+                )
+            to_francs(projection.by_CF(real=True)).to_excel(
+                writer, sheet_name="CFs (real)"
+            )
+    logger.info("done")
+
+
+def __index(df, indexation):
+    """
+    Indexes the budgets of the monthly ledger lines.
+
+    The projections index the total of each CF, rule and month (see projections.Projection), so
+    the first line of each total takes the rounding difference with the lines indexed one by one.
+    This way the indexed ledger adds up exactly to the projections.
+
+    returns:
+        (np.ndarray): the nominal budgets in centimes
+        (np.ndarray): the real budgets in centimes
+    """
+    budgets = df["budget"].to_numpy(dtype=np.int64)
+    codes = indexation.category_codes(df["rule"])
+    months = month_index(df["date"])
+    nominal, real = indexation.index(budgets, codes, months)
+
+    groups = (
+        df.groupby(["CF", "rule", "date"], sort=False, dropna=False).ngroup().to_numpy()
+    )
+    first_lines = np.unique(groups, return_index=True)[1]
+    totals = np.zeros(len(first_lines), dtype=np.int64)
+    np.add.at(totals, groups, budgets)
+    total_nominal, total_real = indexation.index(
+        totals, codes[first_lines], months[first_lines]
+    )
+
+    for amounts, total in [(nominal, total_nominal), (real, total_real)]:
+        sums = np.zeros(len(first_lines), dtype=np.int64)
+        np.add.at(sums, groups, amounts)
+        amounts[first_lines] += total - sums
+    return nominal, real
+
+
+def __final_cleanup(df, indexation=None):
     """
     Performs the last operations on the final dataframe.
     This includes:
+    * expand the periods into monthly ledger lines
+    * index the budgets, keeping the real budgets in a column named real budget
     * add columns named year and month aimed at easing the manipulation of data in Excel
+    * convert the budgets from centimes to francs
     """
     logger.info("Starting final cleanup")
 
+    df = expand_periods(df)
+    columns = ["CF", "date", "year", "month", "budget", "rule", "note"]
+
+    if indexation is not None:
+        df["budget"], df["real budget"] = __index(df, indexation)
+        df["real budget"] = to_francs(df["real budget"])
+        columns.insert(5, "real budget")
+    df["budget"] = to_francs(df["budget"])
+
     df["year"] = df["date"].dt.year
     df["month"] = df["date"].dt.month
 
-    df = df[["CF", "date", "year", "month", "budget", "rule", "note"]]
+    df = df[columns]
 
     logger.info("done")
     return df
 
 
-def main(params):
-    logger.info("Started running the simulation")
+def get_params():
+    """
+    Returns the parameters of the simulation, as found in the settings
+    """
+    params = {
+        "simulation_start": settings.START_DATE,
+        "simulation_end": settings.END_DATE,
+    }
+    if cohorts_settings.REPLACE_RETIREMENTS:
+        params["replacements"] = {
+            "lag": cohorts_settings.REPLACEMENT_LAG,
+            "rank": cohorts_settings.REPLACEMENT_RANK,
+            "age": cohorts_settings.REPLACEMENT_AGE,
+            "retirement_age": cohorts_settings.RETIREMENT_AGE,
+        }
+    if indexation_settings.INDEX_AMOUNTS:
+        params["indexation"] = Indexation()
+    return params
 
-    # boilerplate
-    return_value = pd.DataFrame()
+
+def run_rules(params, loaded_inputs, ledger, names=None, dump_milestones=True):
+    """
+    Runs the rules and stores their periods in the ledger, replacing the periods they had calculated before.
+
+    parameters:
+        params (dict): the parameters of the simulation
+            params['milestones'] (list): Optional, the milestones of a previous run of the lab
+                budgets rule to reuse (see lab_budgets.MILESTONE_SETTINGS)
+        loaded_inputs (dict): the inputs of the rules, as returned by inputs.load_all
+        ledger (LedgerIndex): the ledger to store the periods in
+        names (list): the rules to run. Defaults to all the rules (see RULES).
+            The rules a rule depends on (see DEPENDENCIES) must already be in the ledger.
+        dump_milestones (bool): whether to dump the milestones of the lab budgets rule to file
+
+    returns:
+        (list): the milestones of the lab budgets rule, None when it did not run
+    """
+    if names is None:
+        names = RULES
+    milestones = None
 
     # Lab budget rule
-    logger.info("Running the lab budgets rules")
-    run_params = {
-        "start_date": params["simulation_start"],
-        "end_date": params["simulation_end"],
-    }
-    current_df, milestones = lab_budgets.main(run_params)
-    return_value = pd.concat([return_value, current_df], ignore_index=True)
+    if "lab_budgets" in names:
+        logger.info("Running the lab budgets rules")
+        run_params = {
+            "start_date": params["simulation_start"],
+            "end_date": params["simulation_end"],
+            "inputs": loaded_inputs["lab_budgets"],
+            "replacements": params.get("replacements"),
+            "milestones": params.get("milestones"),
+        }
+        current_df, milestones = lab_budgets.main(run_params)
+        ledger.remove(lab_budgets.RULE_NAME)
+        ledger.add(current_df)
 
-    __dump_milestones(milestones)
-    logger.info("done")
+        if dump_milestones:
+            __dump_milestones(milestones)
+        logger.info("done")
 
     # Fixed budgets
-    logger.info("Running the fixed budgets rules")
-    run_params = {
-        "start_date": params["simulation_start"],
-        "end_date": params["simulation_end"],
-        "ledger": return_value,
-    }
-    df_fixed_budgets = lab_negotiated_budgets.main(run_params)
-    return_value = pd.concat([return_value, df_fixed_budgets], ignore_index=True)
-    logger.info("done")
+    if "lab_negotiated_budgets" in names:
+        logger.info("Running the fixed budgets rules")
+        run_params = {
+            "start_date": params["simulation_start"],
+            "end_date": params["simulation_end"],
+            "ledger": ledger,
+            "inputs": loaded_inputs["lab_negotiated_budgets"],
+        }
+        df_fixed_budgets = lab_negotiated_budgets.main(run_params)
+        ledger.remove(lab_negotiated_budgets.RULE_NAME)
+        ledger.add(df_fixed_budgets)
+        logger.info("done")
 
     # Adjustments
-    logger.info("Started running the adjustments rules")
-    run_params = {
-        "start_date": params["simulation_start"],
-        "end_date": params["simulation_end"],
-    }
-    df_adjusments = adjustments.main(run_params)
-    return_value = pd.concat([return_value, df_adjusments], ignore_index=True)
-    logger.info("done")
+    if "adjustments" in names:
+        logger.info("Started running the adjustments rules")
+        run_params = {
+            "start_date": params["simulation_start"],
+            "end_date": params["simulation_end"],
+            "inputs": loaded_inputs["adjustments"],
+        }
+        df_adjusments = adjustments.main(run_params)
+        ledger.remove(adjustments.RULE_NAME)
+        ledger.add(df_adjusments)
+        logger.info("done")
 
     # Yearly budgets
-    logger.info("Starting running the yearly budget rules")
-    run_params = {
-        "start_date": params["simulation_start"],
-        "end_date": params["simulation_end"],
-    }
-    df_yearly_budgets = non_lab_budgets.main(run_params)
-    return_value = pd.concat([return_value, df_yearly_budgets], ignore_index=True)
+    if "non_lab_budgets" in names:
+        logger.info("Starting running the yearly budget rules")
+        run_params = {
+            "start_date": params["simulation_start"],
+            "end_date": params["simulation_end"],
+            "inputs": loaded_inputs["non_lab_budgets"],
+        }
+        df_yearly_budgets = non_lab_budgets.main(run_params)
+        ledger.remove(non_lab_budgets.RULE_NAME)
+        ledger.add(df_yearly_budgets)
+        logger.info("done")
+
+    return milestones
+
+
+def export(ledger, loaded_inputs, indexation=None):
+    """
+    Calculates the projections and dumps them along with the ledger
+
+    parameters:
+        ledger (LedgerIndex): the periods of all the rules
+        loaded_inputs (dict): the inputs of the rules, as returned by inputs.load_all
+        indexation (Indexation): optional, the indexation of the budgets (see get_params)
+    """
+    # Cumulative budgets
+    logger.info("Starting running the projections")
+    return_value = ledger.periods()
+    projection = projections.Projection(
+        return_value, loaded_inputs["projections"], indexation
+    )
+    __dump_projections(projection)
     logger.info("done")
 
-    return_value = __final_cleanup(return_value)
+    return_value = __final_cleanup(return_value, indexation)
 
     __dump_output(return_value)
 
 
+def export_rules(ledger, loaded_inputs, indexation=None, names=None):
+    """
+    Calculates the projections and dumps them along with the ledger, the monthly lines of each
+    rule going to its own file (see __get_rule_output_file) instead of settings.OUTPUT_FILE.
+    Only the files of the given rules get written again, the others are kept as they are.
+
+    parameters:
+        ledger (LedgerIndex): the periods of all the rules
+        loaded_inputs (dict): the inputs of the rules, as returned by inputs.load_all
+        indexation (Indexation): optional, the indexation of the budgets (see get_params)
+        names (list): the rules whose monthly lines changed. Defaults to all the rules.
+    """
+    logger.info("Starting running the projections")
+    projection = projections.Projection(
+        ledger.periods(), loaded_inputs["projections"], indexation
+    )
+    __dump_projections(projection)
+    logger.info("done")
+
+    if names is None:
+        names = RULES
+
+    for name in names:
+        # a rule emitting no periods gets an empty file, the previous lines are out of date
+        rule_name = inputs.RULES[name].RULE_NAME
+        df = __final_cleanup(ledger.periods(rule=rule_name), indexation)
+
+        logger.info("Dumping the {} to file".format(rule_name))
+        logger.debug("file path: {}".format(__get_rule_output_file(name)))
+        df.to_excel(__get_rule_output_file(name), index=False)
+        logger.info("done")
+
+
+def __parse_bounds(name, lower, upper):
+    """
+    Parses the bounds of a parameter given on the command line: ints when the current value of
+    the setting is an int (e.g. periods in months), floats otherwise
+    """
+    import goal_seek
+
+    module, attribute, _ = goal_seek.find_parameter(name)
+    if not isinstance(getattr(module, attribute), (int, np.integer)):
+        kind, parse = "numbers", float
+    else:
+        kind, parse = "integers", int
+    try:
+        return parse(lower), parse(upper)
+    except ValueError:
+        raise goal_seek.GoalSeekError("The bounds of {} must be {}".format(name, kind))
+
+
+def main(params):
+    logger.info("Started running the simulation")
+
+    # All the input files are parsed concurrently before running the rules
+    loaded_inputs = inputs.load_all()
+
+    # boilerplate
+    # The rules return periods (1 line per CF and run of months with the same budget),
+    # they only get expanded into monthly lines when dumping the output.
+    # They are kept sorted by rule, CF and date so the following rules can look them up.
+    ledger = LedgerIndex()
+
+    run_rules(params, loaded_inputs, ledger)
+    export(ledger, loaded_inputs, params.get("indexation"))
+
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
-    params = {
-        "simulation_start": settings.START_DATE,
-        "simulation_end": settings.END_DATE,
-    }
 
-    main(params)
+    parser = argparse.ArgumentParser(description="STI budget simulator")
+    parser.add_argument(
+        "command",
+        nargs="?",
+        default="run",
+        choices=["run", "watch", "goal-seek"],
+        help="run the simulation once, run it again every time an input or a setting changes "
+        "(writing the monthly lines of each rule to its own file instead of the output file), "
+        "or find the values of some settings giving a yearly total",
+    )
+    goal_seek_arguments = parser.add_argument_group("goal-seek")
+    goal_seek_arguments.add_argument("--year", type=int, help="the year of the total")
+    goal_seek_arguments.add_argument(
+        "--target", type=float, help="the target total, in francs"
+    )
+    goal_seek_arguments.add_argument(
+        "--parameter",
+        nargs=3,
+        action="append",
+        metavar=("NAME", "LOWER", "UPPER"),
+        help="a setting to solve for (e.g. PO_YEARLY_BUDGET or lab_budgets.PA_TO_PO_PERIOD) "
+        "and its bounds. Several parameters move together from their lower to their upper bounds.",
+    )
+    goal_seek_arguments.add_argument(
+        "--CF", action="append", help="only count the budgets of this CF"
+    )
+    goal_seek_arguments.add_argument(
+        "--unit", action="append", help="only count the budgets of the CFs of this unit"
+    )
+    goal_seek_arguments.add_argument(
+        "--rule",
+        action="append",
+        help='only count the budgets of this rule (e.g. "lab budgets")',
+    )
+    goal_seek_arguments.add_argument(
+        "--real",
+        action="store_true",
+        help="count the real budgets instead of the nominal ones",
+    )
+    goal_seek_arguments.add_argument(
+        "--method", choices=["linear", "bisection"], default="linear"
+    )
+    goal_seek_arguments.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.0,
+        help="the largest accepted difference with the target, in francs",
+    )
+    arguments = parser.parse_args()
+
+    if arguments.command == "watch":
+        import watch
+
+        watch.main()
+    elif arguments.command == "goal-seek":
+        import goal_seek
+
+        if (
+            arguments.year is None
+            or arguments.target is None
+            or not arguments.parameter
+        ):
+            parser.error("goal-seek requires --year, --target and --parameter")
+
+        try:
+            goal_seek.main(
+                arguments.year,
+                arguments.target,
+                {
+                    name: __parse_bounds(name, lower, upper)
+                    for name, lower, upper in arguments.parameter
+                },
+                CFs=arguments.CF,
+                units=arguments.unit,
+                rules=arguments.rule,
+                real=arguments.real,
+                method=arguments.method,
+                tolerance=arguments.tolerance,
+            )
+        except goal_seek.GoalSeekError as error:
+            # e.g. an unknown parameter, or bounds not bracketing the target
+            parser.error(str(error))
+    else:
+        main(get_params())
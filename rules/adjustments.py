@@ -3,6 +3,7 @@ import logging
 import os
 import sys
 
+import numpy as np
 import pandas as pd
 
 
@@ -10,42 +11,73 @@ project_folder = os.path.realpath(os.path.join(os.path.dirname(__file__), ".."))
 os.chdir(project_folder)
 sys.path.insert(0, project_folder)
 from settings import adjustments as settings
+from rules.money import to_centimes
+from rules.periods import first_month_on_or_after, last_month_on_or_before, make_periods
 
 logger = logging.getLogger(__name__)
 
+RULE_NAME = "adjustments"
+
 
 def __get_adjustments_rules():
     df = pd.read_excel(settings.ADJUSTMENTS_RULES_FILE_PATH)
     return df
 
 
+def input_files():
+    """
+    Returns the paths of the files read by this rule
+    """
+    return [settings.ADJUSTMENTS_RULES_FILE_PATH]
+
+
+def load_inputs():
+    """
+    Reads and parses the inputs of this rule, so they can be given to main through params["inputs"]
+    """
+    return __get_adjustments_rules()
+
+
 def main(params):
+    """
+    Returns the periods of the adjustments rules that fall within the simulation
+
+    parameters:
+        params (dict): a dictionary containing the start_date and end_date of the simulation,
+            and optionally the inputs returned by load_inputs
+
+    returns:
+        (pd.DataFrame): the adjustments periods
+    """
     logger.info("Started main adjustments routine")
     logger.debug(params)
 
-    return_value = pd.DataFrame(columns=["CF", "date", "budget", "rule", "note"])
+    rules = params.get("inputs")
+    if rules is None:
+        rules = __get_adjustments_rules()
 
-    simulation_period = pd.date_range(
-        start=params["start_date"], end=params["end_date"], freq="M"
-    )
+    # A rule without From or To never applies, as no date compares with a missing one
+    missing_dates = rules["From"].isna() | rules["To"].isna()
+    if missing_dates.any():
+        logger.warning(
+            "Skipping {} adjustments rules without From or To".format(
+                missing_dates.sum()
+            )
+        )
+        rules = rules.loc[~missing_dates]
 
-    rules = __get_adjustments_rules()
-    for date in simulation_period:
-        logger.debug("Checking rules for simulation date {}".format(date))
-        for index, rule in rules.iterrows():
-            logger.debug("Rule applies from {} to {}".format(rule["From"], rule["To"]))
-            if date >= rule["From"] and date <= rule["To"]:
-                logger.debug("Adding {} to return value".format(rule["Monthly amount"]))
-                return_value = return_value.append(
-                    {
-                        "CF": rule["CF"],
-                        "date": date,
-                        "budget": rule["Monthly amount"],
-                        "rule": "adjustments",
-                        "note": rule["Note"],
-                    },
-                    ignore_index=True,
-                )
+    # A rule applies to every month of the simulation whose month-end date is between From and To
+    simulation_first = first_month_on_or_after(params["start_date"])[0]
+    simulation_last = last_month_on_or_before(params["end_date"])[0]
+
+    return_value = make_periods(
+        rules["CF"].to_numpy(),
+        np.maximum(first_month_on_or_after(rules["From"]), simulation_first),
+        np.minimum(last_month_on_or_before(rules["To"]), simulation_last),
+        to_centimes(rules["Monthly amount"]),
+        RULE_NAME,
+        rules["Note"].to_numpy(),
+    )
     logger.info("finished")
     return return_value
 
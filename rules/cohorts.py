@@ -0,0 +1,161 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from rules.money import split_yearly, to_centimes
+from rules.periods import make_periods
+
+logger = logging.getLogger(__name__)
+
+NOTES = np.array(
+    [
+        "Between the PATT promotion and the first bump in the budget",
+        "Between the first bump budget increase and the promotion as PA",
+        "Between the promotion as PA and the promotion as PO",
+        "1st year after the promotion as PO",
+        "2nd year after the promotion as PO",
+        "3rd year after the promotion as PO",
+        "4th year after the promotion as PO",
+        "Full PO budget",
+    ],
+    dtype=object,
+)
+
+
+def career_periods(career):
+    """
+    Returns the periods of a standard academic career, relative to the PATT promotion.
+
+    parameters:
+        career (dict): the career parameters
+            career['PATT_yearly_budget'] (float): the yearly budget of a PATT
+            career['PO_yearly_budget'] (float): the yearly budget of a PO
+            career['first_step_yearly_budget_increase'] (float): the yearly amount of the first bump
+            career['first_step_budget_period'] (int): the number of months between the PATT promotion and the first bump
+            career['PATT_to_PA_period'] (int): the number of months between the PATT and the PA promotions
+            career['PA_to_PO_period'] (int): the number of months between the PA and the PO promotions
+            career['number_of_years_to_reach_PO_budget'] (int): the number of yearly steps from the PA to the PO budget
+
+    returns:
+        (np.ndarray): the first month of each period (months after the PATT promotion)
+        (np.ndarray): the month following the last month of each period. The last period never ends.
+        (np.ndarray): the yearly budget of each period, in centimes
+    """
+    PATT_budget = to_centimes(career["PATT_yearly_budget"])
+    PO_budget = to_centimes(career["PO_yearly_budget"])
+    PA_budget = (PATT_budget + PO_budget) // 2
+    increase = PO_budget - PA_budget
+    years_to_PO = career["number_of_years_to_reach_PO_budget"]
+
+    first_bump = career["first_step_budget_period"]
+    PA_promotion = career["PATT_to_PA_period"]
+    PO_promotion = PA_promotion + career["PA_to_PO_period"]
+
+    starts = np.array(
+        [0, first_bump, PA_promotion] + [PO_promotion + 12 * step for step in range(5)]
+    )
+    stops = np.append(starts[1:], np.iinfo(np.int64).max)
+    budgets = np.array(
+        [
+            PATT_budget,
+            PATT_budget + to_centimes(career["first_step_yearly_budget_increase"]),
+            PA_budget,
+        ]
+        + [PA_budget + increase * step // years_to_PO for step in range(1, 5)]
+        + [PO_budget],
+        dtype=np.int64,
+    )
+
+    # When the milestones are not in order, the first period wins (see calculate_ledger_for_CF)
+    starts = np.maximum(starts, np.maximum.accumulate(np.r_[0, stops[:-1]]))
+    return starts, stops, budgets
+
+
+def replacement_periods(
+    CFs, vacant_from, first_month, last_month, career, replacements, rule
+):
+    """
+    Returns the periods of the professors hired to replace the retiring ones, generation after
+    generation, until the end of the simulation.
+
+    Every replacement is hired replacements['lag'] months after the chair became vacant, at the rank
+    replacements['rank'], then follows the standard career until the retirement, after which the
+    chair becomes vacant again. All the CFs and generations are computed at once on a
+    (CF, generation, career period) grid.
+
+    parameters:
+        CFs (array-like): the CFs whose professors get replaced
+        vacant_from (array-like): the month index of the first month without professor for each CF
+        first_month (int): the month index of the first month of the simulation
+        last_month (int): the month index of the last month of the simulation
+        career (dict): the career parameters, see career_periods
+        replacements (dict): the replacements parameters
+            replacements['lag'] (int): the number of months between a retirement and the next hire
+            replacements['rank'] (str): the rank of the replacements when hired (PATT, PA or PO)
+            replacements['age'] (int): the age of the replacements when hired
+            replacements['retirement_age'] (int): the age at which the replacements retire
+        rule (str): the name of the rule emitting the periods
+
+    returns:
+        (pd.DataFrame): the periods of all the replacements
+    """
+    logger.info("Calculating the replacement hires")
+
+    CFs = np.asarray(CFs, dtype=object)
+    vacant_from = np.asarray(vacant_from, dtype=np.int64)
+
+    lag = replacements["lag"]
+    tenure = (replacements["retirement_age"] - replacements["age"]) * 12
+    rank_offset = {
+        "PATT": 0,
+        "PA": career["PATT_to_PA_period"],
+        "PO": career["PATT_to_PA_period"] + career["PA_to_PO_period"],
+    }[replacements["rank"]]
+
+    # hire month of every generation, for every CF
+    cycle = tenure + lag
+    first_hire = vacant_from + lag
+    generations = (
+        max(int(np.ceil((last_month + 1 - first_hire.min()) / cycle)), 0)
+        if len(CFs)
+        else 0
+    )
+    hires = first_hire[:, np.newaxis] + cycle * np.arange(generations)[np.newaxis, :]
+    logger.debug("Number of generations: {}".format(generations))
+
+    # career periods of every hire, clipped to the time they spend in the chair and to the simulation
+    starts, stops, budgets = career_periods(career)
+    budgets, remainders = split_yearly(budgets)
+    PATT_promotions = (hires - rank_offset)[:, :, np.newaxis]
+    firsts = np.maximum(PATT_promotions + starts, hires[:, :, np.newaxis])
+    lasts = np.minimum(
+        PATT_promotions + np.minimum(stops, np.iinfo(np.int64).max // 2) - 1,
+        (hires + tenure - 1)[:, :, np.newaxis],
+    )
+    firsts = np.maximum(firsts, first_month)
+    lasts = np.minimum(lasts, last_month)
+
+    shape = firsts.shape
+    generation_numbers = np.broadcast_to(
+        np.arange(1, generations + 1)[:, np.newaxis], shape[1:]
+    )
+    notes = (
+        "Replacement hire "
+        + pd.Series(np.broadcast_to(generation_numbers, shape).ravel()).astype(str)
+        + ": "
+        + pd.Series(np.broadcast_to(NOTES, shape).ravel())
+    )
+
+    return_value = make_periods(
+        np.broadcast_to(CFs[:, np.newaxis, np.newaxis], shape).ravel(),
+        firsts.ravel(),
+        lasts.ravel(),
+        np.broadcast_to(budgets, shape).ravel(),
+        rule,
+        notes.to_numpy(dtype=object),
+        remainder=np.broadcast_to(remainders, shape).ravel(),
+    )
+
+    logger.info("done")
+    return return_value
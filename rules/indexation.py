@@ -0,0 +1,162 @@
+import logging
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+project_folder = os.path.realpath(os.path.join(os.path.dirname(__file__), ".."))
+os.chdir(project_folder)
+sys.path.insert(0, project_folder)
+from settings import indexation as settings
+from rules.money import MONTHS_PER_YEAR
+from rules.periods import month_index
+
+logger = logging.getLogger(__name__)
+
+COMPOUNDINGS = ["yearly", "monthly"]
+
+
+class Indexation(object):
+    """
+    Indexation factors of every cost category over a month grid.
+
+    The factor of a month is the cumulative product of the monthly growths of the category since
+    the base month, whose factor is 1. The factors of a grid are computed once for all the
+    categories, so indexing amounts is a single multiply by the factors of their category and month.
+    The amounts of the rules without category keep a factor of 1.
+    """
+
+    def __init__(
+        self,
+        base_date=None,
+        table=None,
+        compounding=None,
+        rule_categories=None,
+        deflator=None,
+    ):
+        """
+        parameters (all of them default to the indexation settings):
+            base_date (datetime.datetime): the date whose money the amounts are in
+            table (dict): the yearly rates of each category, by year from which they apply
+            compounding (dict): "yearly" or "monthly", by category
+            rule_categories (dict): the category of each rule
+            deflator (str): the category turning the nominal amounts into real ones
+        """
+        super().__init__()
+
+        self.base_month = month_index(
+            [settings.BASE_DATE if base_date is None else base_date]
+        )[0]
+        self.table = settings.INDEX_TABLE if table is None else table
+        self.compounding = settings.COMPOUNDING if compounding is None else compounding
+        self.rule_categories = (
+            settings.RULE_CATEGORIES if rule_categories is None else rule_categories
+        )
+        self.deflator = settings.DEFLATOR if deflator is None else deflator
+
+        self.categories = pd.Index(sorted(self.table))
+        unknown = (set(self.rule_categories.values()) | {self.deflator}) - set(
+            self.categories
+        )
+        if unknown:
+            raise ValueError("Categories without rates: {}".format(sorted(unknown)))
+        for category in self.categories:
+            if self.compounding.get(category, "yearly") not in COMPOUNDINGS:
+                raise ValueError(
+                    "Unknown compounding for {}: {}".format(
+                        category, self.compounding[category]
+                    )
+                )
+
+        self.__grids = {}
+
+    def category_codes(self, rules):
+        """
+        Returns the row of the factors of each rule. The rules without category get the last row.
+
+        parameters:
+            rules (array-like): the rule of each amount
+
+        returns:
+            (np.ndarray): the rows in the factors, see factors
+        """
+        categories = pd.Series(np.asarray(rules, dtype=object)).map(
+            self.rule_categories
+        )
+        codes = self.categories.get_indexer(categories)
+        return np.where(codes < 0, len(self.categories), codes)
+
+    def __growths(self, category, months):
+        """
+        Returns the growth of a category during each month
+        """
+        table = self.table[category]
+        years = np.array(sorted(table), dtype=np.int64)
+        rates = np.array([table[year] for year in years], dtype=float)
+        # rate of the latest year of the table not after the month
+        position = np.searchsorted(
+            years, months // MONTHS_PER_YEAR + 1970, side="right"
+        )
+        rate = rates[np.maximum(position - 1, 0)]
+
+        if self.compounding.get(category, "yearly") == "monthly":
+            return (1 + rate) ** (1 / MONTHS_PER_YEAR)
+        return np.where(months % MONTHS_PER_YEAR == 0, 1 + rate, 1.0)
+
+    def factors(self, first_month, number_of_months):
+        """
+        Returns the factors of every category over a month grid. They are computed once by grid.
+
+        parameters:
+            first_month (int): the month index of the first month of the grid
+            number_of_months (int): the number of months of the grid
+
+        returns:
+            (np.ndarray): the factors, 1 line per category (plus a last line of 1 for the rules
+                without category) and 1 column per month
+        """
+        key = (int(first_month), int(number_of_months))
+        if key not in self.__grids:
+            # the grid is extended to the base month, so its factor can be brought back to 1
+            start = min(first_month, self.base_month)
+            stop = max(first_month + number_of_months, self.base_month + 1)
+            months = np.arange(start, stop)
+
+            growths = np.ones((len(self.categories) + 1, len(months)))
+            for row, category in enumerate(self.categories):
+                growths[row] = self.__growths(category, months)
+            cumulated = np.cumprod(growths, axis=1)
+            cumulated /= cumulated[:, [self.base_month - start]]
+
+            self.__grids[key] = cumulated[
+                :, first_month - start : first_month - start + number_of_months
+            ]
+        return self.__grids[key]
+
+    def index(self, budgets, codes, months):
+        """
+        Indexes amounts, rounding the results to the centime.
+
+        parameters:
+            budgets (array-like): the amounts in centimes, in money of the base date
+            codes (array-like): the rows of the factors, see category_codes. Broadcast with budgets.
+            months (array-like): the month indices of the amounts. Broadcast with budgets.
+
+        returns:
+            (np.ndarray): the nominal amounts in centimes
+            (np.ndarray): the real amounts in centimes, in money of the base date
+        """
+        months = np.asarray(months, dtype=np.int64)
+        if months.size == 0:
+            empty = np.zeros(np.broadcast(budgets, codes, months).shape, dtype=np.int64)
+            return empty, empty.copy()
+
+        first_month = months.min()
+        factors = self.factors(first_month, months.max() - first_month + 1)
+        positions = months - first_month
+        deflator = self.categories.get_loc(self.deflator)
+
+        nominal = np.rint(budgets * factors[codes, positions]).astype(np.int64)
+        real = np.rint(nominal / factors[deflator, positions]).astype(np.int64)
+        return nominal, real
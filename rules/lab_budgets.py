@@ -4,8 +4,8 @@ import logging
 import math
 import os
 import sys
-from statistics import mean
 
+import numpy as np
 import pandas as pd
 from dateutil import rrule
 
@@ -14,9 +14,29 @@ project_folder = os.path.realpath(os.path.join(os.path.dirname(__file__), ".."))
 os.chdir(project_folder)
 sys.path.insert(0, project_folder)
 from settings import lab_budgets as settings
+from rules.cohorts import replacement_periods
+from rules.money import split_yearly, to_centimes
+from rules.periods import (
+    fill_gaps,
+    first_month_on_or_after,
+    last_month_before,
+    last_month_on_or_before,
+    make_periods,
+    month_index,
+)
 
 logger = logging.getLogger(__name__)
 
+RULE_NAME = "lab budgets"
+
+# The settings the milestones depend on. As long as they and the inputs don't change, the
+# milestones returned by main can be given back to it instead of being calculated again.
+MILESTONE_SETTINGS = [
+    "PATT_TO_PA_PERIOD",
+    "PA_TO_PO_PERIOD",
+    "FIRST_STEP_BUDGET_PERIOD",
+]
+
 
 class __prof(object):
     def __init__(self):
@@ -27,11 +47,10 @@ class __prof(object):
         self.PATT_promotion = None
         self.PA_promotion = None
         self.PO_promotion = None
-        self.PATT_budget = settings.PATT_YEARLY_BUDGET / 12
-        self.PA_budget = (
-            (settings.PATT_YEARLY_BUDGET + settings.PO_YEARLY_BUDGET) / 2
-        ) / 12
-        self.PO_budget = settings.PO_YEARLY_BUDGET / 12
+        # yearly budgets, in centimes
+        self.PATT_budget = to_centimes(settings.PATT_YEARLY_BUDGET)
+        self.PO_budget = to_centimes(settings.PO_YEARLY_BUDGET)
+        self.PA_budget = (self.PATT_budget + self.PO_budget) // 2
 
 
 def __get_parameters():
@@ -43,18 +62,66 @@ def __get_parameters():
     return params
 
 
+def __get_career():
+    """
+    Returns the parameters of a standard academic career, as used for the replacement hires
+    """
+    return {
+        "PATT_yearly_budget": settings.PATT_YEARLY_BUDGET,
+        "PO_yearly_budget": settings.PO_YEARLY_BUDGET,
+        "first_step_yearly_budget_increase": settings.FIRST_STEP_YEARLY_BUDGET_INCREASE,
+        "first_step_budget_period": settings.FIRST_STEP_BUDGET_PERIOD,
+        "PATT_to_PA_period": settings.PATT_TO_PA_PERIOD,
+        "PA_to_PO_period": settings.PA_TO_PO_PERIOD,
+        "number_of_years_to_reach_PO_budget": settings.NUMBER_OF_YEARS_TO_REACH_PO_BUDGET,
+    }
+
+
+def input_files():
+    """
+    Returns the paths of the files read by this rule
+    """
+    return [settings.PARAMETERS_FILE_PATH]
+
+
+def load_inputs():
+    """
+    Reads and parses the inputs of this rule, so they can be given to main through params["inputs"]
+    """
+    return __get_parameters()
+
+
 def main(params):
-    return_value = pd.DataFrame()
+    """
+    Calculates the lab budgets periods of all the CFs found in the parameters file
+
+    parameters:
+        params (dict): A dictionary object containing the simulation start and end dates,
+            and optionally the inputs returned by load_inputs
+        params['replacements'] (dict): Optional, when given the retiring professors get replaced
+            by new hires (see cohorts.replacement_periods for the expected keys)
+        params['milestones'] (list): Optional, the milestones returned by a previous run with the
+            same inputs and milestone settings (see MILESTONE_SETTINGS)
+
+    returns:
+        (pd.DataFrame): the periods of all the CFs, covering the whole simulation
+        (list): the milestones of each CF
+    """
+    # The month ranges of all the CFs are turned into periods at once
+    CFs, firsts, lasts, budgets, notes = [], [], [], [], []
     milestones = []
 
-    CF_parameters = __get_parameters()
+    CF_parameters = params.get("inputs")
+    if CF_parameters is None:
+        CF_parameters = __get_parameters()
     all_milestones = {}
+    cached_milestones = params.get("milestones")
 
     simulation_start = params["start_date"]
     simulation_end = params["end_date"]
 
     logger.info("Started running the budget rules")
-    for index, row in CF_parameters.iterrows():
+    for position, (index, row) in enumerate(CF_parameters.iterrows()):
 
         # Build the parameters used for this particular CF
         run_params = {}
@@ -78,34 +145,77 @@ def main(params):
         if not math.isnan(row["PO yearly budget"]):
             run_params["PO_yearly_budget"] = row["PO yearly budget"]
 
+        if cached_milestones is not None:
+            run_params["milestones"] = cached_milestones[position]
+
         # Calculate the ledger for that CF
-        current_milestones, current_df = calculate_ledger_for_CF(run_params)
+        (
+            current_milestones,
+            current_firsts,
+            current_lasts,
+            current_budgets,
+            current_notes,
+        ) = __calculate_periods_for_CF(run_params)
 
         # quickly add the CF to the milestone so we don't loose it
         current_milestones["CF"] = row["CF"]
 
-        return_value = pd.concat([return_value, current_df], ignore_index=True)
+        CFs += [row["CF"]] * len(current_firsts)
+        firsts += current_firsts
+        lasts += current_lasts
+        budgets += current_budgets
+        notes += current_notes
         milestones.append(current_milestones)
 
+    periods = __make_periods(params, CFs, firsts, lasts, budgets, notes)
+
+    # Cohort simulation: the chairs get filled again after the retirements
+    if params.get("replacements"):
+        retirements = pd.DataFrame(milestones, columns=["CF", "retirement"]).dropna()
+        vacant_from = last_month_before(retirements["retirement"]) + 1
+        last_months = periods.groupby("CF")["to"].max().reindex(retirements["CF"])
+        vacant_from = np.maximum(
+            vacant_from, month_index(last_months.fillna(pd.Timestamp(0))) + 1
+        )
+
+        replacements = replacement_periods(
+            retirements["CF"],
+            vacant_from,
+            first_month_on_or_after(simulation_start)[0],
+            last_month_on_or_before(simulation_end)[0],
+            __get_career(),
+            params["replacements"],
+            RULE_NAME,
+        )
+        periods = pd.concat([periods, replacements], ignore_index=True)
+
+    # Months before the PATT promotion and after the retirement get no budget
+    return_value = fill_gaps(
+        periods,
+        simulation_start,
+        simulation_end,
+        RULE_NAME,
+        "outside of calculated values",
+        CFs=CF_parameters["CF"],
+    )
+
     logger.info("done")
     return return_value, milestones
 
 
-def calculate_ledger_for_CF(params):
+def calculate_milestones_for_CF(params):
     """
-    Calculates the expenses made over a period of time according to the regular budget rules
+    Calculates the milestones of the academic career of a CF
 
     parameters:
-    params (dict): A dictionary object containing all the required information to run this simulation
+    params (dict): A dictionary object containing the information on the CF (see main)
 
     returns:
-        (pd.DataFrame): a pandas dataframe containing all the ledger lines of this simulation
+        (dict): the milestones of the academic career
     """
 
     # TODO: check the parameters to make sure we have all the information we will be using
 
-    logger.info("Starting budget simulation for CF {}".format(params["CF"]))
-
     prof = __prof()
     prof.CF = params["CF"]
     prof.DoB = params.get("DOB", None)
@@ -163,15 +273,6 @@ def calculate_ledger_for_CF(params):
                 + pd.offsets.DateOffset(months=settings.PA_TO_PO_PERIOD)
             )
 
-    prof.PATT_budget = (
-        params.get("PATT_yearly_budget", settings.PATT_YEARLY_BUDGET) / 12
-    )
-    prof.PO_budget = params.get("PO_yearly_budget", settings.PO_YEARLY_BUDGET) / 12
-    prof.PA_budget = (
-        params.get("PA_yearly_budget", mean([prof.PATT_budget, prof.PO_budget]) * 12)
-        / 12
-    )
-
     # calculate the date of the first bump in budget
     first_bump_budget_increase_date = prof.PATT_promotion + pd.offsets.DateOffset(
         months=settings.FIRST_STEP_BUDGET_PERIOD
@@ -202,11 +303,96 @@ def calculate_ledger_for_CF(params):
         "retirement": prof.retirementDate,
     }
 
+    return milestones
+
+
+def calculate_ledger_for_CF(params):
+    """
+    Calculates the expenses made over a period of time according to the regular budget rules
+
+    parameters:
+    params (dict): A dictionary object containing all the required information to run this simulation
+    params['milestones'] (dict): Optional, the milestones of the CF as returned by a previous run,
+        so they don't get calculated again (see calculate_milestones_for_CF)
+
+    returns:
+        (dict): the milestones of the academic career
+        (pd.DataFrame): a pandas dataframe containing the periods of this simulation.
+            Months outside of the calculated periods are not part of it.
+    """
+    milestones, firsts, lasts, budgets, notes = __calculate_periods_for_CF(params)
+    return milestones, __make_periods(
+        params, [params["CF"]] * len(firsts), firsts, lasts, budgets, notes
+    )
+
+
+def __make_periods(params, CFs, firsts, lasts, budgets, notes):
+    """
+    Builds the periods of the rule from the month ranges returned by __calculate_periods_for_CF,
+    clipped to the simulation
+    """
+    simulation_first = first_month_on_or_after(params["start_date"])[0]
+    simulation_last = last_month_on_or_before(params["end_date"])[0]
+    monthly_budgets, remainders = split_yearly(np.array(budgets, dtype=np.int64))
+
+    return make_periods(
+        np.array(CFs, dtype=object),
+        np.maximum(np.array(firsts, dtype=np.int64), simulation_first),
+        np.minimum(np.array(lasts, dtype=np.int64), simulation_last),
+        monthly_budgets,
+        RULE_NAME,
+        np.array(notes, dtype=object),
+        remainder=remainders,
+    )
+
+
+def __calculate_periods_for_CF(params):
+    """
+    Calculates the month ranges of the periods of a CF, see calculate_ledger_for_CF
+
+    returns:
+        (dict): the milestones of the academic career
+        (list): the month index of the first month of each period
+        (list): the month index of the last month of each period
+        (list): the yearly budget of each period, in centimes
+        (list): the note of each period
+    """
+    logger.info("Starting budget simulation for CF {}".format(params["CF"]))
+
+    milestones = params.get("milestones")
+    if milestones is None:
+        milestones = calculate_milestones_for_CF(params)
+
+    prof = __prof()
+    prof.CF = params["CF"]
+    prof.DoB = milestones["DoB"]
+    prof.retirementDate = milestones["retirement"]
+    prof.PATT_promotion = milestones["patt_promotion"]
+    prof.PA_promotion = milestones["pa_promotion"]
+    prof.PO_promotion = milestones["po_promotion"]
+    first_bump_budget_increase_date = milestones["first_bump_budget_increase_date"]
+    po_step1 = milestones["po_step1"]
+    po_step2 = milestones["po_step2"]
+    po_step3 = milestones["po_step3"]
+    po_full = milestones["po_full"]
+
+    # The yearly budgets are in centimes, they get split into monthly amounts once the periods are known
+    prof.PATT_budget = to_centimes(
+        params.get("PATT_yearly_budget", settings.PATT_YEARLY_BUDGET)
+    )
+    prof.PO_budget = to_centimes(
+        params.get("PO_yearly_budget", settings.PO_YEARLY_BUDGET)
+    )
+    if "PA_yearly_budget" in params:
+        prof.PA_budget = to_centimes(params["PA_yearly_budget"])
+    else:
+        prof.PA_budget = (prof.PATT_budget + prof.PO_budget) // 2
+
     # Now that we have the various milstones, we can build a list of periods with the required information.
     # This list is composed of tuples having 4 information:
     #   from: the date the period starts
     #   to: the date the period stops
-    #   budget: the monthly budget during that period
+    #   budget: the yearly budget during that period, in centimes
     #   note: a note giving more details on that period
     periods = list()
 
@@ -221,7 +407,7 @@ def calculate_ledger_for_CF(params):
     # Period 2 is between the first bump budget increase and the promotion as PA
     p2_from = first_bump_budget_increase_date
     p2_to = prof.PA_promotion
-    p2_budget = p1_budget + (settings.FIRST_STEP_YEARLY_BUDGET_INCREASE / 12)
+    p2_budget = p1_budget + to_centimes(settings.FIRST_STEP_YEARLY_BUDGET_INCREASE)
     p2_note = "Between the first bump budget increase and the promotion as PA"
     periods.append((p2_from, p2_to, p2_budget, p2_note))
 
@@ -236,17 +422,18 @@ def calculate_ledger_for_CF(params):
     # Period 4 is the first year after the promotion as PO
     p4_from = prof.PO_promotion
     p4_to = po_step1
-    pa_to_po_monthly_budget_increase = (
-        prof.PO_budget - prof.PA_budget
-    ) / settings.NUMBER_OF_YEARS_TO_REACH_PO_BUDGET
-    p4_budget = p3_budget + pa_to_po_monthly_budget_increase
+    # The budget increases by 1/NUMBER_OF_YEARS_TO_REACH_PO_BUDGET of the difference every year,
+    # rounded down to the centime
+    pa_to_po_budget_increase = prof.PO_budget - prof.PA_budget
+    years_to_po = settings.NUMBER_OF_YEARS_TO_REACH_PO_BUDGET
+    p4_budget = p3_budget + pa_to_po_budget_increase // years_to_po
     p4_note = "1st year after the promotion as PO"
     periods.append((p4_from, p4_to, p4_budget, p4_note))
 
     # Period 5 is the second year after the promotion as PO
     p5_from = po_step1
     p5_to = po_step2
-    p5_budget = p4_budget + pa_to_po_monthly_budget_increase
+    p5_budget = p3_budget + pa_to_po_budget_increase * 2 // years_to_po
     p5_note = "2nd year after the promotion as PO"
     periods.append((p5_from, p5_to, p5_budget, p5_note))
 
@@ -254,14 +441,14 @@ def calculate_ledger_for_CF(params):
     p6 = (po_step2, po_step3)
     p6_from = po_step2
     p6_to = po_step3
-    p6_budget = p5_budget + pa_to_po_monthly_budget_increase
+    p6_budget = p3_budget + pa_to_po_budget_increase * 3 // years_to_po
     p6_note = "3rd year after the promotion as PO"
     periods.append((p6_from, p6_to, p6_budget, p6_note))
 
     # Period 7 is the fourth year after the promotion as PO
     p7_from = po_step3
     p7_to = po_full
-    p7_budget = p6_budget + pa_to_po_monthly_budget_increase
+    p7_budget = p3_budget + pa_to_po_budget_increase * 4 // years_to_po
     p7_note = "4th year after the promotion as PO"
     periods.append((p7_from, p7_to, p7_budget, p7_note))
 
@@ -273,34 +460,38 @@ def calculate_ledger_for_CF(params):
     p8_note = "Full PO budget"
     periods.append((p8_from, p8_to, p8_budget, p8_note))
 
-    # Now that everything is in place, we can start the simulation
-    start_date = params["start_date"]
-    end_date = params["end_date"]
-
-    return_value = pd.DataFrame(columns=["CF", "date", "budget", "rule", "note"])
-
-    simulation_period = pd.date_range(start=start_date, end=end_date, freq="M")
-    for current_month in simulation_period:
-        current_budget = 0
-        current_note = "outside of calculated values"
-
-        for period in periods:
-            if current_month >= period[0] and current_month < period[1]:
-                current_budget = period[2]
-                current_note = period[3]
-                break
-
-        return_value = return_value.append(
-            {
-                "CF": params["CF"],
-                "date": current_month,
-                "budget": current_budget,
-                "rule": "lab budgets",
-                "note": current_note,
-            },
-            ignore_index=True,
+    # Now that everything is in place, we can turn the periods into month ranges.
+    # A month belongs to a period when its month-end date is on or after the start of the period
+    # and strictly before its end. When periods overlap, the first one wins.
+    froms = first_month_on_or_after([period[0] for period in periods])
+    tos = last_month_before([period[1] for period in periods])
+
+    # Cut the timeline at every period boundary and give each piece to the first period covering it
+    boundaries = np.unique(np.concatenate([froms, tos + 1]))
+    firsts, lasts, budgets, notes = [], [], [], []
+    previous_owner = None
+    for first, stop in zip(boundaries[:-1], boundaries[1:]):
+        owner = next(
+            (
+                index
+                for index, (period_from, period_to) in enumerate(zip(froms, tos))
+                if period_from <= first and stop - 1 <= period_to
+            ),
+            None,
         )
-    return milestones, return_value
+        if owner is None:
+            previous_owner = None
+            continue
+        if owner == previous_owner:
+            lasts[-1] = stop - 1
+        else:
+            firsts.append(first)
+            lasts.append(stop - 1)
+            budgets.append(periods[owner][2])
+            notes.append(periods[owner][3])
+        previous_owner = owner
+
+    return milestones, firsts, lasts, budgets, notes
 
 
 if __name__ == "__main__":
@@ -3,6 +3,7 @@ import os
 import sys
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
 
 
@@ -10,9 +11,21 @@ project_folder = os.path.realpath(os.path.join(os.path.dirname(__file__), ".."))
 os.chdir(project_folder)
 sys.path.insert(0, project_folder)
 from settings import lab_negotiated_budgets as settings
+from rules import lab_budgets
+from rules.money import split_yearly, to_centimes, to_francs
+from rules.periods import (
+    PERIOD_COLUMNS,
+    LedgerIndex,
+    first_month_on_or_after,
+    last_month_on_or_before,
+    make_periods,
+    month_end,
+)
 
 logger = logging.getLogger(__name__)
 
+RULE_NAME = "lab negotiated budgets"
+
 
 def __get_fixed_budgets():
     """
@@ -32,169 +45,161 @@ def __get_fixed_budgets():
     fixed_budgets = pd.read_excel(
         settings.FIXED_BUDGETS_FILE_PATH, sheet_name=settings.FIXED_BUDGETS_SHEET_NAME,
     )
-    fixed_budgets["budget"] = fixed_budgets["Annual amount"] / 12
+    # yearly amount in centimes, split by month in main (see money.split_yearly)
+    fixed_budgets["budget"] = to_centimes(fixed_budgets["Annual amount"])
     fixed_budgets.drop(columns=["Annual amount"], inplace=True)
     return fixed_budgets
 
 
-def __get_calculated_budgets(ledger, start, end):
+def input_files():
+    """
+    Returns the paths of the files read by this rule
     """
-    Return a pandas datafrane with all the budget lines that have calculated by the budget rules
+    return [settings.FIXED_BUDGETS_FILE_PATH]
 
-    parameters:
-        (pandas.DataFrame): The current ledger that contains all the rules calculated lines.
-        (datetime.datetime): The start date of the simulation
-        (datetime.datetime): The end date of the simulation
 
-    returns:
-        (pd.DataFrame): a pandas.DataFrame with all the ledger lines calculated by the budget rules
+def load_inputs():
+    """
+    Reads and parses the inputs of this rule, so they can be given to main through parameters["inputs"]
+    """
+    return __get_fixed_budgets()
+
+
+def __get_calculated_budgets(ledger):
     """
+    Return a PeriodLedger with all the budget periods that have been calculated by the budget rules
 
-    logger.info("Getting calculated budget lines.")
-    logger.debug("Number of lines in ledger: {}".format(len(ledger)))
-    logger.debug("Start date: {}".format(start))
-    logger.debug("End date: {}".format(end))
+    parameters:
+        (LedgerIndex): The current ledger that contains all the rules calculated periods.
 
-    ledger = ledger.loc[
-        (ledger["rule"] == "lab budgets")
-        & (ledger["date"] >= start)
-        & (ledger["date"] <= end)
-    ]
-    ledger.drop(columns=["rule", "note"], inplace=True)
+    returns:
+        (PeriodLedger): the periods calculated by the budget rules, ready to be queried
+    """
 
-    logger.debug(("Number of lines in filtered ledger: {}".format(len(ledger))))
-    return ledger
+    logger.info("Getting calculated budget periods.")
+    logger.debug("Number of periods in ledger: {}".format(len(ledger)))
+    logger.debug(
+        "Number of periods in filtered ledger: {}".format(
+            len(ledger.periods(lab_budgets.RULE_NAME))
+        )
+    )
+    return ledger.ledger(lab_budgets.RULE_NAME)
 
 
 def main(parameters):
     """
     Returns a pandas dataframe with all the adjustments required to comply with budgets that are already fixed
-    ATTENTION: It requires the current ledger with all the lines calculated by the budget rules in order to be able to calculate the correct adjustments.j
+    ATTENTION: It requires the current ledger with all the periods calculated by the budget rules in order to be able to calculate the correct adjustments.
+    The fixed budgets of a CF are expected not to overlap.
 
     parameters:
         parameters (dict): a dictionary of parameters values required to run this module
         parameters['start_date'] (datetime.datetime): The start date of the simulation
         parameters['end_date'] (datetime.datetime): The end date of the simulation
-        parameters['ledger'] (pandas.DataFrame): The current ledger that contains all the lines calculated by the budget rules
+        parameters['ledger'] (LedgerIndex): The current ledger that contains all the periods calculated by the budget rules
+        parameters['inputs'] (pandas.DataFrame): Optional, the fixed budgets as returned by load_inputs
 
     returns:
-        (pandas.DataFrame): new lines to be added to the current ledger so the total of the budget by date matches the fixed budget figures
+        (pandas.DataFrame): new periods to be added to the current ledger so the total of the budget by date matches the fixed budget figures
     """
 
     logger.info("Starting the calculate ledger for fixed budgets")
     logger.debug("Start of simulation: {}".format(parameters["start_date"]))
     logger.debug("End of simulation: {}".format(parameters["end_date"]))
     logger.debug(
-        "Number of lines in current ledger: {}".format(len(parameters["ledger"]))
+        "Number of periods in current ledger: {}".format(len(parameters["ledger"]))
     )
 
-    # Get the budget lines that have been already calculated
-    calculated_budgets = __get_calculated_budgets(
-        parameters["ledger"], parameters["start_date"], parameters["end_date"]
-    )
+    # Get the budget periods that have been already calculated
+    calculated_budgets = __get_calculated_budgets(parameters["ledger"])
 
     # Get the fixed budgets
-    fixed_budgets = __get_fixed_budgets()
-
-    # Boilerplate
-    return_value = pd.DataFrame(
-        columns=[
-            "CF",
-            "date",
-            "budget",
-            "theorical_budget",
-            "real_budget",
-            "rule",
-            "note",
-        ]
-    )
-    CFs = fixed_budgets["CF"].unique()
-    logger.debug("Number of CFs: {}".format(len(CFs)))
+    fixed_budgets = parameters.get("inputs")
+    if fixed_budgets is None:
+        fixed_budgets = __get_fixed_budgets()
+    fixed_budgets = fixed_budgets.loc[fixed_budgets["budget"] != 0]
+
+    # A fixed budget without From or To never applies, as no date compares with a missing one
+    missing_dates = fixed_budgets["From"].isna() | fixed_budgets["To"].isna()
+    if missing_dates.any():
+        logger.warning(
+            "Skipping {} fixed budgets without From or To".format(missing_dates.sum())
+        )
+        fixed_budgets = fixed_budgets.loc[~missing_dates]
+    logger.debug("Number of CFs: {}".format(fixed_budgets["CF"].nunique()))
 
-    dates = pd.date_range(
-        start=parameters["start_date"], end=parameters["end_date"], freq="M"
-    )
-    logger.debug("Number of dates: {}".format(len(dates)))
+    simulation_first = first_month_on_or_after(parameters["start_date"])[0]
+    simulation_last = last_month_on_or_before(parameters["end_date"])[0]
+    froms = np.maximum(first_month_on_or_after(fixed_budgets["From"]), simulation_first)
+    tos = np.minimum(last_month_on_or_before(fixed_budgets["To"]), simulation_last)
+
+    real_budgets, real_remainders = split_yearly(fixed_budgets["budget"])
 
-    # Loop over all the CFs and dates to generate the new lines in the ledger
-    for current_CF in CFs:
+    # Within a fixed budget, the adjustment only changes when the calculated budget does
+    return_value = []
+    for current_CF, real_budget, real_remainder, first, last in zip(
+        fixed_budgets["CF"], real_budgets, real_remainders, froms, tos
+    ):
         logger.debug("Current CF: {}".format(current_CF))
+        if last < first:
+            continue
 
-        for current_date in dates:
-            logger.debug("Current date: {}".format(current_date))
-
-            notes = list()
-
-            try:
-                real_budget = fixed_budgets.loc[
-                    (fixed_budgets["CF"] == current_CF)
-                    & (fixed_budgets["From"] <= current_date)
-                    & (fixed_budgets["To"] >= current_date),
-                    "budget",
-                ].iloc[0]
-                logger.debug("real_budget: {}".format(real_budget))
-            except IndexError as ex:
-                logger.debug("No real budget found.")
-                real_budget = None
-
-            if (
-                calculated_budgets.loc[
-                    (calculated_budgets["CF"] == current_CF), "budget"
-                ].count()
-                > 0
-            ):
-                calculated_budget = calculated_budgets.loc[
-                    (calculated_budgets["CF"] == current_CF)
-                    & (calculated_budgets["date"] == current_date),
-                    "budget",
-                ].iloc[0]
-                logger.debug("Calculated budget: {}".format(calculated_budget))
-
-            else:
-                calculated_budget = 0
-                notes.append("CF was not part of the calculated ones.")
-                logger.debug(
-                    "The CF was not part of the calculated ones. Setting the calculated budget to 0"
-                )
-
-            if real_budget:
-                adjustment = real_budget - calculated_budget
-            else:
-                adjustment = 0
-
-            if adjustment != 0:
-                notes.append(
-                    "{:.2f} adjustment because of difference between real budget ({:.2f}) and theorical budget ({:.2f}).".format(
-                        adjustment, real_budget, calculated_budget
-                    )
-                )
-                logger.debug("An adjustment has to be made: {}".format(adjustment))
-
-                return_value = return_value.append(
-                    {
-                        "CF": current_CF,
-                        "date": current_date,
-                        "real_budget": real_budget,
-                        "theorical_budget": calculated_budget,
-                        "budget": adjustment,
-                        "rule": "lab negotiated budgets",
-                        "note": " ".join(notes),
-                    },
-                    ignore_index=True,
-                )
-
-    # cleanup of unused columns
-    logger.debug("Cleaning up the DataFrame")
-    return_value.drop(columns=["theorical_budget", "real_budget"], inplace=True)
-
-    return return_value
+        changes = calculated_budgets.changes(current_CF)
+        starts = np.unique(
+            np.concatenate([[first], changes[(changes > first) & (changes <= last)]])
+        )
+        ends = np.append(starts[1:] - 1, last)
+
+        notes = np.full(len(starts), "", dtype=object)
+        if current_CF in calculated_budgets:
+            calculated_budget, calculated_remainder = calculated_budgets.levels(
+                current_CF, month_end(starts)
+            )
+        else:
+            calculated_budget = np.zeros(len(starts), dtype=np.int64)
+            calculated_remainder = np.zeros(len(starts), dtype=np.int64)
+            notes[:] = "CF was not part of the calculated ones. "
+            logger.debug(
+                "The CF was not part of the calculated ones. Setting the calculated budget to 0"
+            )
+
+        adjustment = real_budget - calculated_budget
+        remainder_adjustment = real_remainder - calculated_remainder
+        notes = [
+            "{}{:.2f} adjustment because of difference between real budget ({:.2f}) and theorical budget ({:.2f}).".format(
+                note,
+                current_adjustment,
+                to_francs(real_budget),
+                current_calculated_budget,
+            )
+            for note, current_adjustment, current_calculated_budget in zip(
+                notes, to_francs(adjustment), to_francs(calculated_budget)
+            )
+        ]
+
+        current_periods = make_periods(
+            current_CF,
+            starts,
+            ends,
+            adjustment,
+            RULE_NAME,
+            np.array(notes, dtype=object),
+            remainder=remainder_adjustment,
+        )
+        return_value.append(
+            current_periods.loc[
+                (current_periods["budget"] != 0) | (current_periods["remainder"] != 0)
+            ]
+        )
+
+    if not return_value:
+        return pd.DataFrame(columns=PERIOD_COLUMNS)
+    return pd.concat(return_value, ignore_index=True)
 
 
 if __name__ == "__main__":
     parameters = {}
     parameters["start_date"] = datetime(2019, 1, 1)
     parameters["end_date"] = datetime(2029, 1, 1)
-    parameters["ledger"] = pd.DataFrame(
-        columns=["CF", "date", "budget", "rule", "note"]
-    )
+    parameters["ledger"] = LedgerIndex()
     print(main(parameters))
@@ -0,0 +1,61 @@
+"""
+Amounts of money are handled as int64 numbers of centimes, from the rules to the aggregations,
+and only get converted back to francs when written to the output files.
+
+Rounding policy:
+* amounts read in francs (input files, settings) are rounded to the nearest centime, ties to even
+* a yearly amount is split into 12 monthly amounts of yearly // 12 centimes, and the remaining
+  yearly % 12 centimes are added to December. The 12 months of a calendar year always add up
+  exactly to the yearly amount (negative amounts included, as the remainder is never negative).
+"""
+
+import numpy as np
+
+CENTIMES_PER_FRANC = 100
+MONTHS_PER_YEAR = 12
+# month index (see periods.month_index) modulo 12 of December
+DECEMBER = 11
+
+
+def to_centimes(francs):
+    """
+    Converts amounts in francs to centimes, rounding to the nearest centime.
+
+    parameters:
+        francs (float or array-like): the amounts in francs. Missing values become 0.
+
+    returns:
+        (np.int64 or np.ndarray): the amounts in centimes
+    """
+    centimes = np.rint(
+        np.nan_to_num(np.asarray(francs, dtype=float)) * CENTIMES_PER_FRANC
+    )
+    return centimes.astype(np.int64)
+
+
+def to_francs(centimes):
+    """
+    Converts amounts in centimes to francs. pandas objects keep their index and columns.
+    """
+    return np.divide(centimes, CENTIMES_PER_FRANC)
+
+
+def split_yearly(yearly):
+    """
+    Splits yearly amounts into monthly amounts.
+
+    parameters:
+        yearly (int or array-like): the yearly amounts in centimes
+
+    returns:
+        (np.int64 or np.ndarray): the amount of each month in centimes
+        (np.int64 or np.ndarray): the remainder added to December in centimes
+    """
+    return np.divmod(np.asarray(yearly, dtype=np.int64), MONTHS_PER_YEAR)
+
+
+def is_december(months):
+    """
+    Returns whether the months designated by their month index are Decembers
+    """
+    return np.asarray(months, dtype=np.int64) % MONTHS_PER_YEAR == DECEMBER
@@ -4,6 +4,7 @@ import re
 import sys
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
 
 
@@ -12,9 +13,18 @@ os.chdir(project_folder)
 sys.path.insert(0, project_folder)
 
 from settings import non_lab_budgets as settings
+from rules.money import split_yearly, to_centimes
+from rules.periods import (
+    first_month_on_or_after,
+    last_month_on_or_before,
+    make_periods,
+    month_index,
+)
 
 logger = logging.getLogger(__name__)
 
+RULE_NAME = "non-lab budgets"
+
 
 def __get_yearly_budgets():
     """
@@ -25,10 +35,24 @@ def __get_yearly_budgets():
     return df
 
 
+def input_files():
+    """
+    Returns the paths of the files read by this rule
+    """
+    return [settings.YEARLY_BUDGET_FILE_PATH]
+
+
+def load_inputs():
+    """
+    Reads and parses the inputs of this rule, so they can be given to main through params["inputs"]
+    """
+    return __get_yearly_budgets()
+
+
 def __calculate_ledger(df, params):
     """
     Turns the dataframe from the yearly budget format (1 line per CF, 1 column per year and 1 yearly budget amount in each cell)
-    into ledger entries that can be output directly
+    into periods (1 period per CF and year) that can be output directly
     """
     columns = list(df.columns)
 
@@ -37,35 +61,36 @@ def __calculate_ledger(df, params):
     [years.append(column) for column in columns if re.match(pattern, str(column))]
     years.sort()
 
-    rows_list = []
-    for cf_index, cf_row in df.iterrows():
-        for year in years:
-            time_points = pd.date_range(
-                start=datetime(year, 1, 1), end=datetime(year, 12, 31), freq="M"
-            )
-            for current_time_point in time_points:
-                if (
-                    current_time_point >= params["start_date"]
-                    and current_time_point <= params["end_date"]
-                    and cf_row[year] != 0
-                ):
-                    CF = cf_row["CF"]
-                    budget = cf_row[year] / 12
-                    rule = "non-lab budgets"
-                    row_dict = {
-                        "CF": CF,
-                        "date": current_time_point,
-                        "budget": budget,
-                        "rule": rule,
-                        "note": "",
-                    }
-                    rows_list.append(row_dict)
-
-    return pd.DataFrame(rows_list)
+    # One line per CF and year, only keeping the years that have a budget
+    yearly = df.melt(
+        id_vars=["CF"], value_vars=years, var_name="year", value_name="amount"
+    )
+    yearly = yearly.loc[yearly["amount"] != 0]
+    first_months = month_index(
+        yearly["year"].astype(int).astype(str).to_numpy().astype("datetime64[Y]")
+    )
+
+    simulation_first = first_month_on_or_after(params["start_date"])[0]
+    simulation_last = last_month_on_or_before(params["end_date"])[0]
+
+    # The yearly amount is split in 12, the remainder goes to December (see money.split_yearly)
+    budgets, remainders = split_yearly(to_centimes(yearly["amount"]))
+
+    return make_periods(
+        yearly["CF"].to_numpy(),
+        np.maximum(first_months, simulation_first),
+        np.minimum(first_months + 11, simulation_last),
+        budgets,
+        RULE_NAME,
+        "",
+        remainder=remainders,
+    )
 
 
 def main(params):
-    df = __get_yearly_budgets()
+    df = params.get("inputs")
+    if df is None:
+        df = __get_yearly_budgets()
     df = __calculate_ledger(df, params)
     return df
 
@@ -0,0 +1,473 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from rules.money import is_december
+
+logger = logging.getLogger(__name__)
+
+# A period is a run of consecutive months during which a CF receives the same monthly amount.
+# "from" and "to" are the month-end dates of the first and the last month of the run (both included).
+# "budget" is the monthly amount and "remainder" the amount added to it in December, both in
+# centimes (see money.split_yearly).
+PERIOD_COLUMNS = ["CF", "from", "to", "budget", "remainder", "rule", "note"]
+LEDGER_COLUMNS = ["CF", "date", "budget", "rule", "note"]
+
+
+def month_index(dates):
+    """
+    Returns the number of months elapsed between January 1970 and the month of each date.
+
+    parameters:
+        dates (array-like): the dates to convert
+
+    returns:
+        (np.ndarray): an int64 array of month indices
+    """
+    return np.asarray(dates, dtype="datetime64[M]").astype(np.int64)
+
+
+def month_end(indices):
+    """
+    Returns the last day of the months designated by their month index.
+
+    parameters:
+        indices (array-like): month indices as returned by month_index
+
+    returns:
+        (pd.DatetimeIndex): the month-end dates
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    days = (indices + 1).astype("datetime64[M]").astype("datetime64[D]") - 1
+    return pd.DatetimeIndex(days.astype("datetime64[ns]"))
+
+
+def first_month_on_or_after(dates):
+    """
+    Returns the index of the first month whose month-end date is on or after each date.
+    """
+    dates = np.asarray(pd.DatetimeIndex(np.atleast_1d(dates)), dtype="datetime64[ns]")
+    indices = month_index(dates)
+    return indices + (dates > np.asarray(month_end(indices))).astype(np.int64)
+
+
+def last_month_before(dates):
+    """
+    Returns the index of the last month whose month-end date is strictly before each date.
+    """
+    dates = np.asarray(pd.DatetimeIndex(np.atleast_1d(dates)), dtype="datetime64[ns]")
+    indices = month_index(dates)
+    return indices - (np.asarray(month_end(indices)) >= dates).astype(np.int64)
+
+
+def last_month_on_or_before(dates):
+    """
+    Returns the index of the last month whose month-end date is on or before each date.
+    """
+    dates = np.asarray(pd.DatetimeIndex(np.atleast_1d(dates)), dtype="datetime64[ns]")
+    indices = month_index(dates)
+    return indices - (np.asarray(month_end(indices)) > dates).astype(np.int64)
+
+
+def make_periods(CF, first, last, budget, rule, note, remainder=0):
+    """
+    Builds a periods DataFrame from month indices, dropping the empty periods (last < first).
+
+    parameters:
+        CF (scalar or array-like): the CF of each period
+        first (array-like): the month index of the first month of each period
+        last (array-like): the month index of the last month of each period (included)
+        budget (scalar or array-like): the monthly amount of each period, in centimes
+        rule (str): the name of the rule emitting the periods
+        note (scalar or array-like): a note giving more details on each period
+        remainder (scalar or array-like): the amount added to the budget in December, in centimes
+
+    returns:
+        (pd.DataFrame): a DataFrame with the PERIOD_COLUMNS columns
+    """
+    first, last = np.broadcast_arrays(
+        np.atleast_1d(np.asarray(first, dtype=np.int64)),
+        np.atleast_1d(np.asarray(last, dtype=np.int64)),
+    )
+    count = len(first)
+
+    periods = pd.DataFrame(
+        {
+            "CF": np.broadcast_to(np.asarray(CF, dtype=object), count),
+            "from": month_end(first),
+            "to": month_end(last),
+            "budget": np.broadcast_to(np.asarray(budget, dtype=np.int64), count),
+            "remainder": np.broadcast_to(np.asarray(remainder, dtype=np.int64), count),
+            "rule": rule,
+            "note": np.broadcast_to(np.asarray(note, dtype=object), count),
+        },
+        columns=PERIOD_COLUMNS,
+    )
+    return periods.loc[last >= first].reset_index(drop=True)
+
+
+def fill_gaps(periods, start_date, end_date, rule, note, CFs=None):
+    """
+    Adds zero-budget periods so that every CF is covered by exactly one period for every month of
+    the simulation.
+
+    parameters:
+        periods (pd.DataFrame): the periods to complete. They must not overlap within a CF.
+        start_date (datetime.datetime): the start date of the simulation
+        end_date (datetime.datetime): the end date of the simulation
+        rule (str): the rule of the zero-budget periods
+        note (str): the note of the zero-budget periods
+        CFs (array-like): the CFs to cover. Defaults to the CFs present in periods.
+
+    returns:
+        (pd.DataFrame): periods with the zero-budget periods added, sorted by CF and date
+    """
+    simulation_first = first_month_on_or_after(start_date)[0]
+    simulation_last = last_month_on_or_before(end_date)[0]
+
+    periods = periods.sort_values(["CF", "from"], kind="stable").reset_index(drop=True)
+    first = month_index(periods["from"])
+    last = month_index(periods["to"])
+    CFs_found = periods["CF"].to_numpy()
+
+    # a new CF starts wherever the CF differs from the previous row
+    new_CF = np.ones(len(periods), dtype=bool)
+    new_CF[1:] = CFs_found[1:] != CFs_found[:-1]
+    end_of_CF = np.roll(new_CF, -1)
+
+    # the gap before a period starts right after the previous period of the same CF
+    previous_last = np.roll(last, 1)
+    previous_last[new_CF] = simulation_first - 1
+    gaps_before = make_periods(CFs_found, previous_last + 1, first - 1, 0, rule, note)
+
+    # and there may be a gap between the last period of a CF and the end of the simulation
+    gaps_after = make_periods(
+        CFs_found[end_of_CF], last[end_of_CF] + 1, simulation_last, 0, rule, note
+    )
+
+    # CFs without any period get a single zero-budget period
+    missing_CFs = (
+        [] if CFs is None else pd.Index(CFs).unique().difference(pd.Index(CFs_found))
+    )
+    missing = make_periods(
+        np.asarray(missing_CFs, dtype=object),
+        np.full(len(missing_CFs), simulation_first),
+        np.full(len(missing_CFs), simulation_last),
+        0,
+        rule,
+        note,
+    )
+
+    return_value = pd.concat(
+        [periods, gaps_before, gaps_after, missing], ignore_index=True
+    )
+    return return_value.sort_values(["CF", "from"], kind="stable").reset_index(
+        drop=True
+    )
+
+
+def expand_periods(periods):
+    """
+    Turns periods into monthly ledger lines (one line per CF and month).
+    This is only meant to be used when exporting the results, every other computation should work
+    on the periods themselves.
+
+    parameters:
+        periods (pd.DataFrame): the periods to expand
+
+    returns:
+        (pd.DataFrame): a DataFrame with the LEDGER_COLUMNS columns
+    """
+    logger.info("Expanding {} periods into monthly lines".format(len(periods)))
+
+    first = month_index(periods["from"])
+    last = month_index(periods["to"])
+    lengths = np.maximum(last - first + 1, 0)
+
+    rows = np.repeat(np.arange(len(periods)), lengths)
+    # offset of each line within its own period
+    offsets = np.arange(lengths.sum()) - np.repeat(
+        np.cumsum(lengths) - lengths, lengths
+    )
+    months = first[rows] + offsets
+
+    budget = periods["budget"].to_numpy(dtype=np.int64)[rows]
+    remainder = periods["remainder"].to_numpy(dtype=np.int64)[rows]
+
+    return_value = pd.DataFrame(
+        {
+            "CF": periods["CF"].to_numpy()[rows],
+            "date": month_end(months),
+            "budget": budget + remainder * is_december(months),
+            "rule": periods["rule"].to_numpy()[rows],
+            "note": periods["note"].to_numpy()[rows],
+        },
+        columns=LEDGER_COLUMNS,
+    )
+
+    logger.info("done")
+    return return_value
+
+
+class PeriodLedger(object):
+    """
+    Point and range queries over periods.
+
+    The monthly budget of each CF is stored as a step function: the sorted months where the budget
+    changes, the budget and the December remainder from that month on, and the total budget of all
+    the months before it. All the amounts are integer centimes, so the totals are exact.
+    Overlapping periods (e.g. several rules for the same CF) add up.
+    Both queries are answered by a binary search over the boundaries of the CF.
+    """
+
+    def __init__(self, periods):
+        super().__init__()
+
+        first = month_index(periods["from"])
+        stop = month_index(periods["to"]) + 1
+        budget = periods["budget"].to_numpy(dtype=np.int64)
+        remainder = periods["remainder"].to_numpy(dtype=np.int64)
+
+        steps = pd.DataFrame(
+            {
+                "CF": np.concatenate(
+                    [periods["CF"].to_numpy(), periods["CF"].to_numpy()]
+                ),
+                "month": np.concatenate([first, stop]),
+                "delta": np.concatenate([budget, -budget]),
+                "remainder_delta": np.concatenate([remainder, -remainder]),
+            }
+        )
+        steps = (
+            steps.groupby(["CF", "month"], sort=True)[["delta", "remainder_delta"]]
+            .sum()
+            .reset_index()
+        )
+        levels = steps.groupby("CF")[["delta", "remainder_delta"]].cumsum()
+        steps["level"] = levels["delta"]
+        steps["remainder"] = levels["remainder_delta"]
+
+        # total of the months between a boundary and the next one of the same CF,
+        # counting the Decembers with floor divisions (see money.is_december)
+        next_month = steps.groupby("CF")["month"].shift(-1).fillna(steps["month"])
+        next_month = next_month.astype(np.int64)
+        area = steps["level"] * (next_month - steps["month"]) + steps["remainder"] * (
+            next_month // 12 - steps["month"] // 12
+        )
+        steps["total_before"] = area.groupby(steps["CF"]).cumsum() - area
+
+        self._months = steps["month"].to_numpy(dtype=np.int64)
+        self._levels = steps["level"].to_numpy(dtype=np.int64)
+        self._remainders = steps["remainder"].to_numpy(dtype=np.int64)
+        self._totals = steps["total_before"].to_numpy(dtype=np.int64)
+
+        CFs = steps["CF"].to_numpy()
+        starts = np.flatnonzero(CFs[1:] != CFs[:-1]) + 1
+        bounds = np.concatenate([[0], starts, [len(CFs)]]) if len(CFs) else []
+        self._slices = {CFs[lo]: (lo, hi) for lo, hi in zip(bounds[:-1], bounds[1:])}
+
+    @property
+    def CFs(self):
+        return list(self._slices.keys())
+
+    def __contains__(self, CF):
+        return CF in self._slices
+
+    def __len__(self):
+        """
+        Returns the number of stored boundaries
+        """
+        return len(self._months)
+
+    def changes(self, CF):
+        """
+        Returns the month indices where the budget of a CF changes, in increasing order
+        """
+        if CF not in self._slices:
+            return np.zeros(0, dtype=np.int64)
+        lo, hi = self._slices[CF]
+        return self._months[lo:hi]
+
+    def _cumulated(self, CF, months):
+        """
+        Returns the total budget of all the months strictly before each of the given months
+        """
+        lo, hi = self._slices[CF]
+        position = np.searchsorted(self._months[lo:hi], months, side="right") - 1
+        before_first = position < 0
+        position = lo + np.maximum(position, 0)
+
+        total = (
+            self._totals[position]
+            + self._levels[position] * (months - self._months[position])
+            + self._remainders[position] * (months // 12 - self._months[position] // 12)
+        )
+        return np.where(before_first, 0, total)
+
+    def levels(self, CF, date):
+        """
+        Returns the monthly budget and the December remainder of a CF for the month of the given date(s).
+
+        parameters:
+            CF: the CF
+            date (datetime.datetime or array-like): the date(s) to look up
+
+        returns:
+            (np.ndarray): the monthly budgets in centimes. 0 if the CF is unknown.
+            (np.ndarray): the December remainders in centimes. 0 if the CF is unknown.
+        """
+        months = month_index(np.atleast_1d(date))
+
+        if CF not in self._slices:
+            return np.zeros(len(months), dtype=np.int64), np.zeros(
+                len(months), dtype=np.int64
+            )
+
+        lo, hi = self._slices[CF]
+        position = np.searchsorted(self._months[lo:hi], months, side="right") - 1
+        found = position >= 0
+        position = lo + np.maximum(position, 0)
+        return (
+            np.where(found, self._levels[position], 0),
+            np.where(found, self._remainders[position], 0),
+        )
+
+    def budget_at(self, CF, date):
+        """
+        Returns the budget of a CF for the month of the given date(s), December remainder included.
+
+        parameters:
+            CF: the CF
+            date (datetime.datetime or array-like): the date(s) to look up
+
+        returns:
+            (np.int64 or np.ndarray): the monthly budget(s) in centimes. 0 if the CF is unknown.
+        """
+        scalar = np.ndim(date) == 0
+        budget, remainder = self.levels(CF, date)
+        months = month_index(np.atleast_1d(date))
+        return_value = budget + remainder * is_december(months)
+
+        return return_value[0] if scalar else return_value
+
+    def total(self, CF, start_date, end_date):
+        """
+        Returns the total budget of a CF over the months whose month-end date is between
+        start_date and end_date (both included).
+
+        parameters:
+            CF: the CF
+            start_date (datetime.datetime or array-like): the start date(s) of the range(s)
+            end_date (datetime.datetime or array-like): the end date(s) of the range(s)
+
+        returns:
+            (np.int64 or np.ndarray): the total budget(s) in centimes. 0 if the CF is unknown.
+        """
+        scalar = np.ndim(start_date) == 0 and np.ndim(end_date) == 0
+        first = first_month_on_or_after(start_date)
+        stop = last_month_on_or_before(end_date) + 1
+        first, stop = np.broadcast_arrays(first, np.maximum(stop, first))
+
+        if CF not in self._slices:
+            return_value = np.zeros(len(first), dtype=np.int64)
+        else:
+            return_value = self._cumulated(CF, stop) - self._cumulated(CF, first)
+
+        return return_value[0] if scalar else return_value
+
+
+class LedgerIndex(object):
+    """
+    The periods of all the rules run so far, sorted by rule, CF and start date.
+
+    Each rule's periods are stored in their own frame sorted by CF and date, along with the
+    position of each CF in it, so the periods of a (rule, CF) pair are a contiguous slice.
+    Rules reconciling against the results of previous rules get them through periods()
+    for contiguous slices, or ledger() for O(log n) point and range queries.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.__periods = {}
+        self.__slices = {}
+        self.__ledgers = {}
+
+    def add(self, periods):
+        """
+        Adds the periods calculated by one or several rules.
+
+        parameters:
+            periods (pd.DataFrame): the periods to add
+        """
+        for rule, rule_periods in periods.groupby("rule", sort=False):
+            if rule in self.__periods:
+                rule_periods = pd.concat(
+                    [self.__periods[rule], rule_periods], ignore_index=True
+                )
+            rule_periods = rule_periods.sort_values(
+                ["CF", "from"], kind="stable"
+            ).reset_index(drop=True)
+
+            CFs = rule_periods["CF"].to_numpy()
+            starts = np.flatnonzero(CFs[1:] != CFs[:-1]) + 1
+            bounds = np.concatenate([[0], starts, [len(CFs)]]) if len(CFs) else []
+
+            self.__periods[rule] = rule_periods
+            self.__slices[rule] = {
+                CFs[lo]: (lo, hi) for lo, hi in zip(bounds[:-1], bounds[1:])
+            }
+            self.__ledgers.pop(rule, None)
+
+    def remove(self, rule):
+        """
+        Removes all the periods of a rule
+        """
+        self.__periods.pop(rule, None)
+        self.__slices.pop(rule, None)
+        self.__ledgers.pop(rule, None)
+
+    @property
+    def rules(self):
+        return list(self.__periods.keys())
+
+    def __contains__(self, rule):
+        return rule in self.__periods
+
+    def __len__(self):
+        return sum(len(periods) for periods in self.__periods.values())
+
+    def periods(self, rule=None, CF=None):
+        """
+        Returns the periods of a rule, optionally restricted to a CF.
+
+        parameters:
+            rule (str): the rule. Defaults to all the rules, in the order they were added.
+            CF: the CF. Defaults to all the CFs.
+
+        returns:
+            (pd.DataFrame): the periods, sorted by CF and date
+        """
+        if rule is None:
+            if CF is not None:
+                raise ValueError("A rule is required to get the periods of a CF")
+            if not self.__periods:
+                return pd.DataFrame(columns=PERIOD_COLUMNS)
+            return pd.concat(self.__periods.values(), ignore_index=True)
+
+        if rule not in self.__periods:
+            return pd.DataFrame(columns=PERIOD_COLUMNS)
+        if CF is None:
+            return self.__periods[rule]
+
+        lo, hi = self.__slices[rule].get(CF, (0, 0))
+        return self.__periods[rule].iloc[lo:hi]
+
+    def ledger(self, rule):
+        """
+        Returns a PeriodLedger answering queries on the periods of a rule.
+        It is built on first use and kept until the periods of the rule change.
+        """
+        if rule not in self.__ledgers:
+            self.__ledgers[rule] = PeriodLedger(self.periods(rule))
+        return self.__ledgers[rule]
@@ -0,0 +1,250 @@
+import logging
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+project_folder = os.path.realpath(os.path.join(os.path.dirname(__file__), ".."))
+os.chdir(project_folder)
+sys.path.insert(0, project_folder)
+from settings import projections as settings
+from rules.money import is_december
+from rules.periods import month_end, month_index
+
+logger = logging.getLogger(__name__)
+
+
+def __get_units():
+    """
+    Returns the unit of each CF, as found in the correspondence table
+
+    returns:
+        (pd.Series): the units indexed by CF.
+            None when the table doesn't have the columns given in the settings.
+    """
+    logger.info("Getting the units from file")
+    logger.debug("Units file: {}".format(settings.UNITS_FILE_PATH))
+
+    df = pd.read_excel(settings.UNITS_FILE_PATH)
+    missing = [
+        column
+        for column in [settings.UNITS_CF_COLUMN, settings.UNITS_UNIT_COLUMN]
+        if column not in df.columns
+    ]
+    if missing:
+        logger.warning(
+            "Columns {} not found in the units file, the projections by unit are skipped".format(
+                ", ".join(missing)
+            )
+        )
+        return None
+
+    df = df.dropna(subset=[settings.UNITS_CF_COLUMN]).drop_duplicates(
+        subset=[settings.UNITS_CF_COLUMN]
+    )
+    return df.set_index(settings.UNITS_CF_COLUMN)[settings.UNITS_UNIT_COLUMN]
+
+
+def input_files():
+    """
+    Returns the paths of the files read by the projections
+    """
+    return [settings.UNITS_FILE_PATH]
+
+
+def load_inputs():
+    """
+    Reads and parses the units of the CFs, so they can be given to Projection (None when unknown)
+    """
+    return __get_units()
+
+
+class Projection(object):
+    """
+    Monthly and cumulative budgets of every CF, unit and of the whole school.
+
+    The periods are laid out on a (CF, month) grid: the monthly budgets are the prefix sums of the
+    budget changes along the months, and the cumulative budgets are the prefix sums of the monthly
+    budgets. Both are computed for all the CFs at once, in integer centimes.
+
+    With an indexation, the grid has 1 line per CF and rule, which gets multiplied by the factors
+    of the cost category of its rule before adding up the lines of each CF, so that the rounding
+    matches the indexed ledger lines. The nominal budgets are kept along with the real ones.
+    """
+
+    def __init__(self, periods, units=None, indexation=None):
+        """
+        parameters:
+            periods (pd.DataFrame): the final periods of the simulation
+            units (pd.Series): optional, the unit of each CF (indexed by CF)
+            indexation (Indexation): optional, the indexation of the budgets
+        """
+        super().__init__()
+        logger.info("Projecting {} periods".format(len(periods)))
+
+        first = month_index(periods["from"])
+        stop = month_index(periods["to"]) + 1
+        budget = periods["budget"].to_numpy(dtype=np.int64)
+        remainder = periods["remainder"].to_numpy(dtype=np.int64)
+
+        CF_codes, self.CFs = pd.factorize(periods["CF"], sort=True)
+        self.first_month = first.min() if len(first) else 0
+        number_of_months = (stop.max() - self.first_month) if len(stop) else 0
+        self.dates = month_end(np.arange(number_of_months) + self.first_month)
+
+        # 1 line per CF, or per CF and rule when indexed
+        if indexation is None:
+            codes, lines = CF_codes, np.arange(len(self.CFs))
+        else:
+            rule_codes, rules = pd.factorize(periods["rule"])
+            codes, lines = pd.factorize(CF_codes * len(rules) + rule_codes)
+        number_of_lines = len(lines)
+
+        # +budget on the first month of each period, -budget on the month after its end
+        changes = np.zeros((number_of_lines, number_of_months + 1), dtype=np.int64)
+        np.add.at(changes, (codes, first - self.first_month), budget)
+        np.add.at(changes, (codes, stop - self.first_month), -budget)
+        remainder_changes = np.zeros_like(changes)
+        np.add.at(remainder_changes, (codes, first - self.first_month), remainder)
+        np.add.at(remainder_changes, (codes, stop - self.first_month), -remainder)
+
+        # the remainders are only paid in December
+        months = np.arange(number_of_months) + self.first_month
+        monthly = np.cumsum(changes[:, :-1], axis=1) + is_december(months) * np.cumsum(
+            remainder_changes[:, :-1], axis=1
+        )
+
+        self.monthly = monthly
+        self.real_monthly = None
+        if indexation is not None:
+            # the rule of each line is the remainder of its code, see above
+            line_categories = indexation.category_codes(rules)[
+                np.asarray(lines) % len(rules)
+            ]
+            nominal, real = indexation.index(
+                monthly, line_categories[:, np.newaxis], months[np.newaxis, :]
+            )
+            line_CFs = np.asarray(lines) // len(rules)
+            self.monthly = np.zeros((len(self.CFs), number_of_months), dtype=np.int64)
+            self.real_monthly = np.zeros_like(self.monthly)
+            np.add.at(self.monthly, line_CFs, nominal)
+            np.add.at(self.real_monthly, line_CFs, real)
+
+        self.cumulative = np.cumsum(self.monthly, axis=1)
+        self.real_cumulative = (
+            None if self.real_monthly is None else np.cumsum(self.real_monthly, axis=1)
+        )
+
+        self.units = None
+        if units is not None:
+            self.units = pd.Series(units).reindex(self.CFs).fillna("unknown").to_numpy()
+
+        logger.info("done")
+
+    def __month_position(self, date):
+        """
+        Returns the position in the month grid of the month of the given date
+        """
+        return month_index(np.atleast_1d(date))[0] - self.first_month
+
+    def __view(self, real):
+        """
+        Returns the monthly and the cumulative budgets of each CF, nominal or real
+        """
+        if not real:
+            return self.monthly, self.cumulative
+        if self.real_monthly is None:
+            raise ValueError("The projection was built without indexation")
+        return self.real_monthly, self.real_cumulative
+
+    def by_CF(self, real=False):
+        """
+        Returns the cumulative budget of each CF, 1 line per CF and 1 column per month.
+        The budgets are nominal, or real (in money of the indexation base date) when real is True.
+        """
+        cumulative = self.__view(real)[1]
+        return pd.DataFrame(cumulative, index=self.CFs, columns=self.dates)
+
+    def by_unit(self, real=False):
+        """
+        Returns the cumulative budget of each unit, 1 line per unit and 1 column per month.
+        The budgets are nominal, or real (in money of the indexation base date) when real is True.
+        """
+        if self.units is None:
+            raise ValueError("The projection was built without the units of the CFs")
+
+        codes, units = pd.factorize(self.units, sort=True)
+        monthly = np.zeros((len(units), len(self.dates)), dtype=np.int64)
+        np.add.at(monthly, codes, self.__view(real)[0])
+        return pd.DataFrame(np.cumsum(monthly, axis=1), index=units, columns=self.dates)
+
+    def school(self):
+        """
+        Returns the monthly and the running total budget of the whole school,
+        and their real counterparts when the projection is indexed
+        """
+        monthly = self.monthly.sum(axis=0)
+        return_value = pd.DataFrame(
+            {"date": self.dates, "budget": monthly, "cumulative": np.cumsum(monthly)}
+        )
+        if self.real_monthly is not None:
+            real_monthly = self.real_monthly.sum(axis=0)
+            return_value["real budget"] = real_monthly
+            return_value["real cumulative"] = np.cumsum(real_monthly)
+        return return_value
+
+    def first_month_exceeding(self, thresholds, since=None, CFs=None, real=False):
+        """
+        Returns the first month in which the cumulative budget of each CF exceeds its threshold.
+
+        parameters:
+            thresholds (int or array-like): the threshold in centimes, or one threshold per CF
+            since (datetime.datetime): the date from which the budget is cumulated.
+                Defaults to the beginning of the projection.
+            CFs (array-like): the CFs to look at. Defaults to all the CFs.
+            real (bool): whether to look at the real budgets instead of the nominal ones
+
+        returns:
+            (pd.Series): the month-end date of the first month exceeding the threshold, indexed by CF.
+                NaT when the threshold is never exceeded.
+        """
+        rows = np.arange(len(self.CFs)) if CFs is None else self.CFs.get_indexer(CFs)
+        if (rows < 0).any():
+            raise KeyError("Unknown CFs: {}".format(list(np.asarray(CFs)[rows < 0])))
+
+        start = (
+            0
+            if since is None
+            else min(max(self.__month_position(since), 0), len(self.dates))
+        )
+        all_cumulative = self.__view(real)[1]
+        cumulative = all_cumulative[rows, start:]
+        if start > 0:
+            cumulative = cumulative - all_cumulative[rows, start - 1 : start]
+
+        # Budgets can be negative, but the first month exceeding the threshold is also the first
+        # month where the running maximum exceeds it, and the running maximum is sorted.
+        running_max = np.maximum.accumulate(cumulative, axis=1)
+
+        # Shifting each CF by a different offset sorts the whole matrix, so that all the CFs
+        # are looked up with a single binary search
+        length = running_max.shape[1]
+        lowest = running_max.min() if running_max.size else 0
+        highest = running_max.max() if running_max.size else 0
+        span = highest - lowest + 1
+        offsets = np.arange(len(rows)) * span - lowest
+        flat = (running_max + offsets[:, np.newaxis]).ravel()
+
+        # thresholds are kept within the values of their CF so they don't land in another CF
+        thresholds = np.broadcast_to(np.asarray(thresholds, dtype=np.int64), len(rows))
+        thresholds = np.clip(thresholds, lowest - 1, highest)
+        positions = (
+            np.searchsorted(flat, thresholds + offsets, side="right")
+            - np.arange(len(rows)) * length
+        )
+
+        found = positions < length
+        dates = np.full(len(rows), np.datetime64("NaT"), dtype="datetime64[ns]")
+        dates[found] = np.asarray(self.dates)[start + positions[found]]
+        return pd.Series(dates, index=self.CFs[rows], name="date")
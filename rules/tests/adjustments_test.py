@@ -0,0 +1,31 @@
+import datetime
+
+import pandas as pd
+
+from .. import adjustments
+from ..periods import expand_periods
+
+
+class TestAdjustments:
+    def test_rules_without_dates_are_skipped(self):
+        rules = pd.DataFrame(
+            {
+                "CF": [1234, 5678, 9012],
+                "From": pd.to_datetime(["2020-01-15", None, "2020-01-01"]),
+                "To": pd.to_datetime(["2020-06-30", "2020-06-30", None]),
+                "Monthly amount": [100.0, 200.0, 300.0],
+                "Note": ["a", "no From", "no To"],
+            }
+        )
+
+        periods = adjustments.main(
+            {
+                "start_date": datetime.datetime(2019, 1, 1),
+                "end_date": datetime.datetime(2021, 1, 1),
+                "inputs": rules,
+            }
+        )
+
+        df = expand_periods(periods)
+        assert df["CF"].tolist() == [1234] * 6
+        assert df["date"].min() == datetime.datetime(2020, 1, 31)
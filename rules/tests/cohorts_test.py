@@ -0,0 +1,70 @@
+import datetime
+
+import numpy as np
+
+from .. import cohorts
+from ..money import is_december
+from ..periods import expand_periods, month_index
+
+
+class TestCohorts:
+    career = {
+        "PATT_yearly_budget": 445000,
+        "PO_yearly_budget": 1000000,
+        "first_step_yearly_budget_increase": 65000,
+        "first_step_budget_period": 36,
+        "PATT_to_PA_period": 81,
+        "PA_to_PO_period": 81,
+        "number_of_years_to_reach_PO_budget": 5,
+    }
+
+    def __get_replacements(self, rank="PATT"):
+        return {"lag": 12, "rank": rank, "age": 35, "retirement_age": 65}
+
+    def test_replacements_chain_until_the_end_of_the_simulation(self):
+        first_month = month_index([datetime.datetime(2020, 1, 1)])[0]
+        last_month = month_index([datetime.datetime(2119, 12, 1)])[0]
+
+        periods = cohorts.replacement_periods(
+            ["1234", "5678"],
+            [first_month, first_month + 100],
+            first_month,
+            last_month,
+            self.career,
+            self.__get_replacements(),
+            "lab budgets",
+        )
+        df = expand_periods(periods)
+
+        # No month is counted twice and each 30 years career is followed by a 12 months vacancy
+        assert not df.duplicated(["CF", "date"]).any()
+        months = month_index(df.loc[df["CF"] == "1234", "date"])
+        assert months.min() == first_month + 12
+        assert months.max() == last_month
+        assert len(months) == (last_month - first_month + 1) - 12 * 4
+
+        # Each new hire starts with the PATT budget and ends with the full PO budget
+        hires = df.loc[df["note"].str.endswith("first bump in the budget")]
+        decembers = is_december(month_index(hires["date"]))
+        assert (hires["budget"] == 44500000 // 12 + 44500000 % 12 * decembers).all()
+        assert df["note"].str.startswith("Replacement hire 4:").any()
+
+    def test_replacements_can_be_hired_as_PO(self):
+        first_month = month_index([datetime.datetime(2020, 1, 1)])[0]
+
+        periods = cohorts.replacement_periods(
+            ["1234"],
+            [first_month],
+            first_month,
+            first_month + 12 * 40,
+            self.career,
+            self.__get_replacements("PO"),
+            "lab budgets",
+        )
+
+        first_period = periods.sort_values("from").iloc[0]
+        assert (
+            first_period["note"]
+            == "Replacement hire 1: 1st year after the promotion as PO"
+        )
+        assert month_index([first_period["from"]])[0] == first_month + 12
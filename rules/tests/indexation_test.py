@@ -0,0 +1,106 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from .. import indexation, projections
+from ..periods import PERIOD_COLUMNS, expand_periods, month_index
+
+
+class TestIndexation:
+    def __get_indexation(self):
+        return indexation.Indexation(
+            base_date=datetime.datetime(2020, 1, 1),
+            table={"salaries": {2020: 0.1, 2022: 0.2}, "prices": {2020: 0.12}},
+            compounding={"salaries": "yearly", "prices": "monthly"},
+            rule_categories={
+                "lab budgets": "salaries",
+                "lab negotiated budgets": "salaries",
+                "non-lab budgets": "prices",
+            },
+            deflator="prices",
+        )
+
+    def __get_periods(self):
+        return pd.DataFrame(
+            {
+                "CF": ["1234", "1234", "5678"],
+                "from": [
+                    datetime.datetime(2019, 1, 31),
+                    datetime.datetime(2020, 1, 31),
+                    datetime.datetime(2019, 6, 30),
+                ],
+                "to": [
+                    datetime.datetime(2023, 12, 31),
+                    datetime.datetime(2021, 12, 31),
+                    datetime.datetime(2022, 6, 30),
+                ],
+                "budget": [100000, 5000, 20000],
+                "remainder": [7, 0, 0],
+                "rule": ["lab budgets", "non-lab budgets", "adjustments"],
+                "note": "",
+            },
+            columns=PERIOD_COLUMNS,
+        )
+
+    def test_factors_compound_from_the_base_month(self):
+        index = self.__get_indexation()
+        first_month = month_index([datetime.datetime(2019, 1, 1)])[0]
+        factors = index.factors(first_month, 12 * 5)
+        # 1 line per category, in alphabetical order, then 1 line for the rules without category
+        prices, salaries, not_indexed = factors
+
+        # yearly: a step every January, with the rate of the latest year of the table
+        assert np.allclose(salaries[[0, 11, 12, 23]], [1 / 1.1, 1 / 1.1, 1, 1])
+        assert np.isclose(salaries[12 * 4], 1.1 * 1.2 * 1.2)
+        # monthly: 12 steps a year, adding up to the yearly rate
+        assert np.isclose(prices[12], 1) and np.isclose(prices[24], 1.12)
+        assert np.allclose(np.diff(np.log(prices)), np.log(1.12) / 12)
+        assert (not_indexed == 1).all()
+        # the factors of a grid are computed once
+        assert index.factors(first_month, 12 * 5) is factors
+
+    def test_indexed_projection_matches_the_indexed_monthly_lines(self):
+        index = self.__get_indexation()
+        periods = self.__get_periods()
+        projection = projections.Projection(periods, indexation=index)
+
+        lines = expand_periods(periods)
+        lines["nominal"], lines["real"] = index.index(
+            lines["budget"].to_numpy(),
+            index.category_codes(lines["rule"]),
+            month_index(lines["date"]),
+        )
+        for view, real in [("nominal", False), ("real", True)]:
+            expected = lines.pivot_table(
+                index="CF", columns="date", values=view, aggfunc="sum", fill_value=0
+            ).cumsum(axis=1)
+            assert (projection.by_CF(real=real).to_numpy() == expected.to_numpy()).all()
+
+        # the adjustments are not indexed, but they get deflated
+        adjustments = lines.loc[lines["rule"] == "adjustments"]
+        assert (adjustments["nominal"] == 20000).all()
+        assert adjustments["real"].iloc[0] > 20000 > adjustments["real"].iloc[-1]
+        school = projection.school()
+        assert school["cumulative"].iloc[-1] == lines["nominal"].sum()
+        assert school["real cumulative"].iloc[-1] == lines["real"].sum()
+
+    def test_the_rules_of_a_category_are_indexed_separately(self):
+        index = self.__get_indexation()
+        periods = self.__get_periods()
+        periods.loc[len(periods)] = periods.loc[0]
+        periods.loc[len(periods) - 1, ["budget", "rule"]] = [
+            33333,
+            "lab negotiated budgets",
+        ]
+        projection = projections.Projection(periods, indexation=index)
+
+        lines = expand_periods(periods)
+        nominal, real = index.index(
+            lines["budget"].to_numpy(),
+            index.category_codes(lines["rule"]),
+            month_index(lines["date"]),
+        )
+        # the amounts of each rule get rounded on their own, like the indexed monthly lines
+        assert projection.monthly.sum() == nominal.sum()
+        assert projection.real_monthly.sum() == real.sum()
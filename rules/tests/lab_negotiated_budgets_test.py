@@ -0,0 +1,32 @@
+import datetime
+
+import pandas as pd
+
+from .. import lab_negotiated_budgets
+from ..money import to_centimes
+from ..periods import LedgerIndex, expand_periods
+
+
+class TestLabNegotiatedBudgets:
+    def test_fixed_budgets_without_dates_are_skipped(self):
+        fixed_budgets = pd.DataFrame(
+            {
+                "CF": [1234, 5678, 9012],
+                "From": pd.to_datetime(["2020-01-01", None, "2020-01-01"]),
+                "To": pd.to_datetime(["2020-12-31", "2020-12-31", None]),
+                "budget": to_centimes([12000, 24000, 36000]),
+            }
+        )
+
+        periods = lab_negotiated_budgets.main(
+            {
+                "start_date": datetime.datetime(2019, 1, 1),
+                "end_date": datetime.datetime(2021, 1, 1),
+                "ledger": LedgerIndex(),
+                "inputs": fixed_budgets,
+            }
+        )
+
+        df = expand_periods(periods)
+        assert df["CF"].tolist() == [1234] * 12
+        assert df["budget"].sum() == to_centimes(12000)
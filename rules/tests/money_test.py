@@ -0,0 +1,30 @@
+import numpy as np
+
+from .. import money
+from ..periods import month_index
+
+
+class TestMoney:
+    def test_francs_get_rounded_to_the_nearest_centime(self):
+        assert list(money.to_centimes([0.005, 0.015, 1.234, -2.5, np.nan])) == [
+            0,
+            2,
+            123,
+            -250,
+            0,
+        ]
+        assert money.to_francs(12345) == 123.45
+
+    def test_the_months_of_a_year_add_up_to_the_yearly_amount(self):
+        yearly = np.array([1200, 1211, -1211, 5, 0])
+        monthly, remainder = money.split_yearly(yearly)
+
+        assert list(monthly) == [100, 100, -101, 0, 0]
+        assert list(remainder) == [0, 11, 1, 5, 0]
+        assert (monthly * 12 + remainder == yearly).all()
+
+    def test_december_is_the_last_month_of_the_year(self):
+        months = month_index(
+            np.array(["2019-11-30", "2019-12-31", "2020-01-31"], dtype="datetime64[ns]")
+        )
+        assert list(money.is_december(months)) == [False, True, False]
@@ -0,0 +1,150 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from .. import periods
+
+
+class TestPeriods:
+    def __get_periods(self):
+        return pd.DataFrame(
+            {
+                "CF": ["1234", "1234", "5678"],
+                "from": [
+                    datetime.datetime(2000, 1, 31),
+                    datetime.datetime(2001, 1, 31),
+                    datetime.datetime(2000, 6, 30),
+                ],
+                "to": [
+                    datetime.datetime(2000, 12, 31),
+                    datetime.datetime(2001, 6, 30),
+                    datetime.datetime(2000, 8, 31),
+                ],
+                "budget": [100, 150, 10],
+                "remainder": [5, 0, 0],
+                "rule": "lab budgets",
+                "note": "",
+            },
+            columns=periods.PERIOD_COLUMNS,
+        )
+
+    def test_month_boundaries_follow_the_month_end_dates(self):
+        assert periods.month_end(periods.month_index([datetime.datetime(2000, 2, 3)]))[
+            0
+        ] == datetime.datetime(2000, 2, 29)
+        # 31.01 is the month end of January, 30.01 is not
+        assert periods.last_month_before(
+            [datetime.datetime(2000, 1, 31)]
+        ) == periods.month_index([datetime.datetime(1999, 12, 1)])
+        assert periods.last_month_on_or_before(
+            [datetime.datetime(2000, 1, 31)]
+        ) == periods.month_index([datetime.datetime(2000, 1, 1)])
+        assert periods.first_month_on_or_after(
+            [datetime.datetime(2000, 1, 31, 12)]
+        ) == periods.month_index([datetime.datetime(2000, 2, 1)])
+
+    def test_expansion_gives_one_line_per_month(self):
+        df = periods.expand_periods(self.__get_periods())
+
+        assert len(df) == 12 + 6 + 3
+        assert df.loc[df["CF"] == "1234", "budget"].sum() == 12 * 100 + 5 + 6 * 150
+        # the remainder is only added in December
+        assert list(df.loc[df["CF"] == "1234", "budget"].iloc[10:13]) == [100, 105, 150]
+        assert df["date"].min() == datetime.datetime(2000, 1, 31)
+        assert df["date"].max() == datetime.datetime(2001, 6, 30)
+
+    def test_gaps_get_filled_with_zero_budget(self):
+        df = periods.fill_gaps(
+            self.__get_periods(),
+            datetime.datetime(1999, 1, 1),
+            datetime.datetime(2002, 1, 1),
+            "lab budgets",
+            "outside of calculated values",
+            CFs=["1234", "5678", "9999"],
+        )
+        expanded = periods.expand_periods(df)
+
+        # 36 months between 31.01.1999 and 31.12.2001 for each of the 3 CFs
+        assert len(expanded) == 3 * 36
+        assert expanded.groupby("CF")["date"].nunique().eq(36).all()
+        assert expanded.loc[expanded["CF"] == "9999", "budget"].sum() == 0
+
+    def test_queries_match_the_monthly_lines(self):
+        source = self.__get_periods()
+        ledger = periods.PeriodLedger(source)
+        expanded = periods.expand_periods(source)
+
+        dates = pd.date_range(
+            start=datetime.datetime(1999, 1, 1),
+            end=datetime.datetime(2002, 1, 1),
+            freq=pd.offsets.MonthEnd(),
+        )
+        for CF in ["1234", "5678"]:
+            monthly = (
+                expanded.loc[expanded["CF"] == CF]
+                .set_index("date")["budget"]
+                .reindex(dates, fill_value=0)
+            )
+            assert (ledger.budget_at(CF, dates) == monthly.to_numpy()).all()
+            assert (
+                ledger.total(
+                    CF, datetime.datetime(2000, 3, 15), datetime.datetime(2001, 2, 28)
+                )
+                == monthly.loc["2000-03-15":"2001-02-28"].sum()
+            )
+
+        assert ledger.budget_at("9999", datetime.datetime(2000, 1, 31)) == 0
+        assert ledger.total("1234", dates[0], dates[-1]) == 12 * 100 + 5 + 6 * 150
+        assert (
+            ledger.total(
+                "1234", datetime.datetime(2000, 1, 31), datetime.datetime(2000, 11, 30)
+            )
+            == 11 * 100
+        )
+        budget, remainder = ledger.levels("1234", datetime.datetime(2000, 6, 30))
+        assert (budget, remainder) == (100, 5)
+
+    def test_overlapping_periods_add_up(self):
+        source = self.__get_periods()
+        source.loc[2, "CF"] = "1234"
+        ledger = periods.PeriodLedger(source)
+
+        assert ledger.budget_at("1234", datetime.datetime(2000, 7, 31)) == 110
+        assert ledger.budget_at("1234", datetime.datetime(2000, 9, 30)) == 100
+
+    def test_ledger_index_gives_the_periods_of_a_rule_and_CF(self):
+        source = self.__get_periods()
+        adjustments = source.copy()
+        adjustments["rule"] = "adjustments"
+
+        ledger = periods.LedgerIndex()
+        ledger.add(source.iloc[::-1])
+        ledger.add(adjustments)
+
+        assert ledger.rules == ["lab budgets", "adjustments"]
+        assert len(ledger) == 6
+        assert list(ledger.periods("lab budgets", "1234")["budget"]) == [100, 150]
+        assert len(ledger.periods("lab budgets", "9999")) == 0
+        assert len(ledger.periods("unknown rule")) == 0
+        assert (
+            ledger.ledger("adjustments").budget_at(
+                "5678", datetime.datetime(2000, 7, 31)
+            )
+            == 10
+        )
+
+        # adding periods to a rule keeps them sorted and refreshes the queries
+        ledger.add(source.iloc[[2]])
+        assert list(ledger.periods("lab budgets")["CF"]) == [
+            "1234",
+            "1234",
+            "5678",
+            "5678",
+        ]
+        assert (
+            ledger.ledger("lab budgets").budget_at(
+                "5678", datetime.datetime(2000, 7, 31)
+            )
+            == 20
+        )
@@ -0,0 +1,99 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from .. import projections
+from ..periods import PERIOD_COLUMNS
+
+
+class TestProjections:
+    def __get_periods(self):
+        return pd.DataFrame(
+            {
+                "CF": ["1234", "1234", "5678", "9999"],
+                "from": [
+                    datetime.datetime(2000, 1, 31),
+                    datetime.datetime(2000, 7, 31),
+                    datetime.datetime(2000, 3, 31),
+                    datetime.datetime(2000, 1, 31),
+                ],
+                "to": [
+                    datetime.datetime(2000, 12, 31),
+                    datetime.datetime(2000, 9, 30),
+                    datetime.datetime(2000, 12, 31),
+                    datetime.datetime(2000, 12, 31),
+                ],
+                "budget": [100, -300, 50, -10],
+                "remainder": [0, 0, 0, 4],
+                "rule": "lab budgets",
+                "note": "",
+            },
+            columns=PERIOD_COLUMNS,
+        )
+
+    def test_cumulative_budgets_by_CF_unit_and_school(self):
+        projection = projections.Projection(
+            self.__get_periods(), pd.Series({"1234": "IBI", "5678": "IBI"})
+        )
+
+        by_CF = projection.by_CF()
+        assert by_CF.loc["1234", pd.Timestamp(2000, 6, 30)] == 600
+        assert by_CF.loc["1234", pd.Timestamp(2000, 12, 31)] == 1200 - 900
+        assert by_CF.loc["5678", pd.Timestamp(2000, 12, 31)] == 500
+
+        by_unit = projection.by_unit()
+        assert by_unit.loc["IBI", pd.Timestamp(2000, 12, 31)] == 800
+        assert by_unit.loc["unknown", pd.Timestamp(2000, 11, 30)] == -110
+        # the remainder of the 12 months is added in December
+        assert by_unit.loc["unknown", pd.Timestamp(2000, 12, 31)] == -120 + 4
+
+        school = projection.school()
+        assert school["cumulative"].iloc[-1] == 800 - 116
+
+    def test_units_are_skipped_when_the_table_does_not_match_the_settings(
+        self, tmp_path, monkeypatch
+    ):
+        path = tmp_path / "units.xlsx"
+        monkeypatch.setattr(projections.settings, "UNITS_FILE_PATH", str(path))
+        monkeypatch.setattr(projections.settings, "UNITS_CF_COLUMN", "CF")
+        monkeypatch.setattr(projections.settings, "UNITS_UNIT_COLUMN", "Unit")
+
+        pd.DataFrame(
+            {"CF": [1234, 1234, 5678], "Unit": ["IBI", "IBI", "IEM"]}
+        ).to_excel(path, index=False)
+        units = projections.load_inputs()
+        assert units.to_dict() == {1234: "IBI", 5678: "IEM"}
+
+        pd.DataFrame({"CF": ["1234"], "Unité": ["IBI"]}).to_excel(path, index=False)
+        assert projections.load_inputs() is None
+
+        projection = projections.Projection(self.__get_periods(), None)
+        assert projection.units is None
+
+    def test_first_month_exceeding_matches_a_linear_scan(self):
+        projection = projections.Projection(self.__get_periods())
+        by_CF = projection.by_CF()
+
+        for since in [None, datetime.datetime(2000, 8, 15)]:
+            for threshold in [-1000, -20, 0, 150, 350, 600, 10000]:
+                found = projection.first_month_exceeding(threshold, since=since)
+                for CF, row in by_CF.iterrows():
+                    if since is not None:
+                        row = row.loc[since:] - row.loc[:since].iloc[-1]
+                    exceeding = row.index[row.to_numpy() > threshold]
+                    expected = exceeding[0] if len(exceeding) else pd.NaT
+                    assert found[CF] == expected or (
+                        pd.isnull(found[CF]) and pd.isnull(expected)
+                    )
+
+    def test_first_month_exceeding_with_one_threshold_per_CF(self):
+        projection = projections.Projection(self.__get_periods())
+
+        found = projection.first_month_exceeding([250, 100], CFs=["1234", "5678"])
+        assert list(found.index) == ["1234", "5678"]
+        assert found["1234"] == pd.Timestamp(2000, 3, 31)
+        assert found["5678"] == pd.Timestamp(2000, 5, 31)
+        assert np.isnat(
+            projection.first_month_exceeding(0, CFs=["9999"]).to_numpy()
+        ).all()
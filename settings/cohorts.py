@@ -0,0 +1,12 @@
+# Cohort simulation: when enabled, every retiring professor gets replaced by a new hire
+REPLACE_RETIREMENTS = False
+
+# Number of months between a retirement and the arrival of the replacement
+REPLACEMENT_LAG = 12
+
+# Academic rank of the replacements when they get hired (PATT, PA or PO)
+REPLACEMENT_RANK = "PATT"
+
+# Age of the replacements when they get hired, and age at which they retire
+REPLACEMENT_AGE = 35
+RETIREMENT_AGE = 65
@@ -0,0 +1,27 @@
+import datetime
+
+# Indexation of the budgets: when enabled, the amounts of the rules are taken as money of the
+# BASE_DATE and get indexed month after month with the rates of their cost category
+INDEX_AMOUNTS = False
+BASE_DATE = datetime.datetime(2019, 1, 1)
+
+# Yearly rates of each cost category, by year from which they apply. The rate of the latest year
+# applies to the following years, the rate of the first year to the previous ones.
+INDEX_TABLE = {
+    "salaries": {2019: 0.01},
+    "prices": {2019: 0.005},
+}
+
+# How each cost category compounds: "yearly" (once a year, in January) or "monthly"
+COMPOUNDING = {"salaries": "yearly", "prices": "monthly"}
+
+# Cost category of each rule. The rules not listed here are not indexed (e.g. the adjustments,
+# which are given in the money of their own dates).
+RULE_CATEGORIES = {
+    "lab budgets": "salaries",
+    "lab negotiated budgets": "salaries",
+    "non-lab budgets": "prices",
+}
+
+# Cost category whose index turns the nominal amounts into real ones (money of the BASE_DATE)
+DEFLATOR = "prices"
@@ -0,0 +1,7 @@
+# Correspondence table giving the unit of each CF
+UNITS_FILE_PATH = "src/Table_correspondance.xlsx"
+UNITS_CF_COLUMN = "CF"
+UNITS_UNIT_COLUMN = "Unit"
+
+# Where the cumulative budgets get dumped
+PROJECTIONS_OUTPUT_FILE = "out/projections.xlsx"
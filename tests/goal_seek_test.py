@@ -0,0 +1,158 @@
+import types
+
+import pandas as pd
+import pytest
+
+import goal_seek
+from rules.money import to_centimes
+from rules.periods import make_periods, month_index
+
+
+class TestGoalSeek:
+    def __get_goal_seek(self, monkeypatch):
+        """
+        Returns a goal seek on a stub rule: CF 1 gets the yearly budget for the period in months
+        starting in January 2025, CF 2 gets nothing.
+        """
+        self.settings = types.SimpleNamespace(YEARLY_BUDGET=12000.0, PERIOD=12)
+        self.other_settings = types.SimpleNamespace(YEARLY_BUDGET=0.0)
+        self.runs = []
+        monkeypatch.setattr(
+            goal_seek,
+            "__get_settings_modules",
+            lambda: {
+                "stub": (self.settings, ["lab_budgets"]),
+                "other": (self.other_settings, []),
+            },
+        )
+
+        def run_rules(params, loaded_inputs, ledger, names=None, dump_milestones=True):
+            self.runs.append(list(names))
+            if "lab_budgets" in names:
+                if self.settings.YEARLY_BUDGET < 0:
+                    raise ValueError("negative budget")
+                first = month_index(pd.DatetimeIndex(["2025-01-31"]))[0]
+                periods = pd.concat(
+                    [
+                        make_periods(
+                            1,
+                            first,
+                            first + self.settings.PERIOD - 1,
+                            to_centimes(self.settings.YEARLY_BUDGET) // 12,
+                            "stub",
+                            "",
+                        ),
+                        make_periods(2, first, first + 11, 0, "stub", ""),
+                    ],
+                    ignore_index=True,
+                )
+                ledger.remove("stub")
+                ledger.add(periods)
+
+        monkeypatch.setattr(goal_seek.runner, "run_rules", run_rules)
+        monkeypatch.setattr(goal_seek.runner, "get_params", lambda: {})
+        return goal_seek.GoalSeek(2025, loaded_inputs={"projections": None})
+
+    def test_unknown_parameters(self, monkeypatch):
+        self.__get_goal_seek(monkeypatch)
+
+        with pytest.raises(goal_seek.GoalSeekError):
+            goal_seek.find_parameter("BUDGET")
+        with pytest.raises(goal_seek.GoalSeekError):
+            goal_seek.find_parameter("stub.BUDGET")
+        with pytest.raises(goal_seek.GoalSeekError):
+            goal_seek.find_parameter("unknown.PERIOD")
+
+    def test_ambiguous_parameters_need_their_settings_module(self, monkeypatch):
+        self.__get_goal_seek(monkeypatch)
+
+        with pytest.raises(goal_seek.GoalSeekError, match="Several settings"):
+            goal_seek.find_parameter("YEARLY_BUDGET")
+        assert goal_seek.find_parameter("other.YEARLY_BUDGET") == (
+            self.other_settings,
+            "YEARLY_BUDGET",
+            [],
+        )
+        assert goal_seek.find_parameter("PERIOD") == (
+            self.settings,
+            "PERIOD",
+            ["lab_budgets"],
+        )
+
+    def test_evaluations_are_cached_and_restore_the_settings(self, monkeypatch):
+        seek = self.__get_goal_seek(monkeypatch)
+
+        assert seek.evaluate({"stub.YEARLY_BUDGET": 6000.0}) == to_centimes(6000)
+        assert seek.evaluate({"PERIOD": 3}) == to_centimes(3000)
+        assert seek.evaluate({"stub.YEARLY_BUDGET": 6000.0}) == to_centimes(6000)
+        assert seek.evaluations == 2
+        assert len(self.runs) == 3
+        assert self.settings.YEARLY_BUDGET == 12000.0
+        assert self.settings.PERIOD == 12
+
+        # the rules modified by the previous evaluation run again with the settings
+        assert seek.evaluate({"other.YEARLY_BUDGET": 1.0}) == to_centimes(12000)
+        assert self.runs[-1] == ["lab_budgets", "lab_negotiated_budgets"]
+        seek.evaluate({"other.YEARLY_BUDGET": 2.0})
+        assert self.runs[-1] == []
+
+    def test_the_settings_are_restored_after_a_failure(self, monkeypatch):
+        seek = self.__get_goal_seek(monkeypatch)
+
+        with pytest.raises(ValueError, match="negative budget") as error:
+            seek.evaluate({"stub.YEARLY_BUDGET": -1.0, "PERIOD": 6})
+        # the errors of the simulation are not mistaken for a bad setup of the goal seek
+        assert not isinstance(error.value, goal_seek.GoalSeekError)
+        assert self.settings.YEARLY_BUDGET == 12000.0
+        assert self.settings.PERIOD == 12
+
+        # the failed rules run again at the next evaluation
+        assert seek.evaluate({"other.YEARLY_BUDGET": 1.0}) == to_centimes(12000)
+        assert self.runs[-1] == ["lab_budgets", "lab_negotiated_budgets"]
+
+    def test_linear_interpolation_takes_fewer_evaluations_than_bisection(
+        self, monkeypatch
+    ):
+        parameters = {"stub.YEARLY_BUDGET": (0.0, 12000.0)}
+
+        linear = self.__get_goal_seek(monkeypatch).solve(4500, parameters)
+        bisection = self.__get_goal_seek(monkeypatch).solve(
+            4500, parameters, method="bisection"
+        )
+
+        for solution in [linear, bisection]:
+            assert solution["converged"]
+            assert solution["total"] == pytest.approx(4500, abs=1)
+            assert solution["parameters"]["stub.YEARLY_BUDGET"] == pytest.approx(
+                4500, abs=1
+            )
+        assert linear["evaluations"] == 3
+        assert bisection["evaluations"] > linear["evaluations"]
+
+    def test_integer_bounds_give_integer_values(self, monkeypatch):
+        seek = self.__get_goal_seek(monkeypatch)
+
+        solution = seek.solve(7500, {"PERIOD": (0, 24)})
+        assert not solution["converged"]
+        assert solution["parameters"] == {"PERIOD": 7}
+        assert isinstance(solution["parameters"]["PERIOD"], int)
+        assert solution["total"] == 7000
+
+    def test_bounds_must_bracket_the_target(self, monkeypatch):
+        seek = self.__get_goal_seek(monkeypatch)
+
+        with pytest.raises(goal_seek.GoalSeekError, match="not between"):
+            seek.solve(20000, {"stub.YEARLY_BUDGET": (0.0, 12000.0)})
+
+    def test_the_parameters_are_checked_before_solving(self, monkeypatch):
+        seek = self.__get_goal_seek(monkeypatch)
+
+        with pytest.raises(goal_seek.GoalSeekError, match="Unknown method"):
+            seek.solve(6000, {"stub.YEARLY_BUDGET": (0.0, 12000.0)}, method="newton")
+        with pytest.raises(goal_seek.GoalSeekError, match="Unknown parameter"):
+            seek.solve(6000, {"BUDGET": (0.0, 12000.0)})
+        with pytest.raises(goal_seek.GoalSeekError, match="bounds"):
+            seek.solve(6000, {"stub.YEARLY_BUDGET": ("0", 12000.0)})
+        with pytest.raises(goal_seek.GoalSeekError, match="free parameter"):
+            seek.solve(6000, {})
+        assert seek.evaluations == 0
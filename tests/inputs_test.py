@@ -0,0 +1,60 @@
+import types
+
+import pandas as pd
+import pytest
+
+import inputs
+
+
+class TestInputs:
+    def __get_rules(self, tmp_path):
+        paths = {}
+        for name in ["first", "second"]:
+            paths[name] = tmp_path / "{}.xlsx".format(name)
+            paths[name].write_bytes(b"")
+
+        return {
+            name: types.SimpleNamespace(
+                input_files=lambda path=path: [str(path)],
+                load_inputs=lambda name=name: pd.DataFrame({"rule": [name]}),
+            )
+            for name, path in paths.items()
+        }
+
+    def test_sources_are_the_absolute_paths_of_the_input_files(
+        self, tmp_path, monkeypatch
+    ):
+        monkeypatch.setattr(inputs, "RULES", self.__get_rules(tmp_path))
+
+        sources = inputs.resolve_sources(["second"])
+        assert sources == {"second": [str((tmp_path / "second.xlsx").resolve())]}
+
+    def test_a_missing_input_file_fails_early(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(inputs, "RULES", self.__get_rules(tmp_path))
+        (tmp_path / "second.xlsx").unlink()
+
+        with pytest.raises(FileNotFoundError, match="second"):
+            inputs.resolve_sources()
+        with pytest.raises(FileNotFoundError):
+            inputs.load_all(use_processes=False)
+
+    def test_every_rule_gets_its_own_inputs(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(inputs, "RULES", self.__get_rules(tmp_path))
+
+        loaded = inputs.load_all(use_processes=False)
+        assert sorted(loaded) == ["first", "second"]
+        assert loaded["first"]["rule"].tolist() == ["first"]
+        assert loaded["second"]["rule"].tolist() == ["second"]
+
+        assert list(inputs.load_all(names=["first"], use_processes=False)) == ["first"]
+
+    def test_the_optional_stages_run_without_their_input_files(
+        self, tmp_path, monkeypatch
+    ):
+        monkeypatch.setattr(inputs, "RULES", self.__get_rules(tmp_path))
+        monkeypatch.setattr(inputs, "OPTIONAL", ["second"])
+        (tmp_path / "second.xlsx").unlink()
+
+        loaded = inputs.load_all(use_processes=False)
+        assert loaded["first"]["rule"].tolist() == ["first"]
+        assert loaded["second"] is None
@@ -0,0 +1,116 @@
+import os
+
+import pandas as pd
+import pytest
+
+import inputs
+import main as runner
+import watch
+from rules import adjustments, projections
+from rules.periods import LedgerIndex, make_periods, month_index
+from settings import cohorts as cohorts_settings
+from settings import indexation as indexation_settings
+from settings import main as settings
+
+
+class TestWatch:
+    def __get_watched_files(self, tmp_path, monkeypatch):
+        sources = {
+            name: [str(tmp_path / "{}.xlsx".format(name))] for name in inputs.RULES
+        }
+        monkeypatch.setattr(inputs, "resolve_sources", lambda names=None: sources)
+
+        # module level names are not mangled, the name is looked up as it is
+        return getattr(watch, "__get_watched_files")()
+
+    def test_the_input_files_invalidate_their_stage(self, tmp_path, monkeypatch):
+        watched_files = self.__get_watched_files(tmp_path, monkeypatch)
+
+        for name in inputs.RULES:
+            assert watched_files[str(tmp_path / "{}.xlsx".format(name))] == {name}
+
+    def test_the_settings_invalidate_the_stages_using_them(self, tmp_path, monkeypatch):
+        watched_files = self.__get_watched_files(tmp_path, monkeypatch)
+
+        for name, module in inputs.RULES.items():
+            assert name in watched_files[os.path.realpath(module.settings.__file__)]
+        assert watched_files[os.path.realpath(settings.__file__)] == set(runner.RULES)
+        assert watched_files[os.path.realpath(cohorts_settings.__file__)] == {
+            "lab_budgets"
+        }
+        assert watched_files[os.path.realpath(indexation_settings.__file__)] == set()
+
+    def test_the_dependent_rules_run_again(self):
+        assert runner.invalidated_rules(["lab_budgets"]) == [
+            "lab_budgets",
+            "lab_negotiated_budgets",
+        ]
+        assert runner.invalidated_rules(["lab_negotiated_budgets"]) == [
+            "lab_negotiated_budgets"
+        ]
+        assert runner.invalidated_rules(["non_lab_budgets", "lab_budgets"]) == [
+            "lab_budgets",
+            "lab_negotiated_budgets",
+            "non_lab_budgets",
+        ]
+        # the projections are not a rule, they are calculated when exporting
+        assert runner.invalidated_rules(["projections"]) == []
+
+    def test_an_indexation_change_exports_again_without_running_the_rules(
+        self, tmp_path, monkeypatch
+    ):
+        watched_files = self.__get_watched_files(tmp_path, monkeypatch)
+        changed_files = [os.path.realpath(indexation_settings.__file__)]
+
+        rules = runner.invalidated_rules(watched_files[changed_files[0]])
+        assert rules == []
+        assert watch.exported_rules(changed_files, rules) == runner.RULES
+
+    def test_only_the_rules_run_again_are_exported_again(self, tmp_path, monkeypatch):
+        watched_files = self.__get_watched_files(tmp_path, monkeypatch)
+        changed_files = [str(tmp_path / "adjustments.xlsx")]
+
+        rules = runner.invalidated_rules(watched_files[changed_files[0]])
+        assert rules == ["adjustments"]
+        assert watch.exported_rules(changed_files, rules) == ["adjustments"]
+
+    def test_a_rule_emitting_no_periods_gets_an_empty_file(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(settings, "OUTPUT_FILE", str(tmp_path / "out.xlsx"))
+        monkeypatch.setattr(
+            projections.settings,
+            "PROJECTIONS_OUTPUT_FILE",
+            str(tmp_path / "projections.xlsx"),
+        )
+        first = month_index(pd.DatetimeIndex(["2025-01-31"]))[0]
+        ledger = LedgerIndex()
+        ledger.add(make_periods(1, first, first + 11, 100, adjustments.RULE_NAME, ""))
+        loaded_inputs = {"projections": None}
+
+        runner.export_rules(ledger, loaded_inputs, names=["adjustments"])
+        output_file = tmp_path / "out_adjustments.xlsx"
+        assert len(pd.read_excel(output_file)) == 12
+
+        # e.g. the adjustments workbook was emptied
+        ledger.remove(adjustments.RULE_NAME)
+        runner.export_rules(ledger, loaded_inputs, names=["adjustments"])
+        assert len(pd.read_excel(output_file)) == 0
+
+    def test_the_output_of_the_run_command_is_removed(self, tmp_path, monkeypatch):
+        output_file = tmp_path / "out.xlsx"
+        output_file.write_bytes(b"")
+        monkeypatch.setattr(settings, "OUTPUT_FILE", str(output_file))
+        monkeypatch.setattr(inputs, "load_all", lambda: {})
+        monkeypatch.setattr(inputs, "resolve_sources", lambda names=None: {})
+        monkeypatch.setattr(runner, "run_rules", lambda *args, **kwargs: None)
+        monkeypatch.setattr(runner, "export_rules", lambda *args, **kwargs: None)
+
+        class Stop(Exception):
+            pass
+
+        def sleep(interval):
+            raise Stop()
+
+        monkeypatch.setattr(watch.time, "sleep", sleep)
+        with pytest.raises(Stop):
+            watch.main()
+        assert not output_file.exists()
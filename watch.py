@@ -0,0 +1,176 @@
+import importlib
+import logging
+import os
+import time
+
+import inputs
+import main as runner
+from main import invalidated_rules
+from rules.periods import LedgerIndex
+from settings import cohorts as cohorts_settings
+from settings import indexation as indexation_settings
+from settings import main as settings
+
+logger = logging.getLogger(__name__)
+
+
+def __get_watched_files():
+    """
+    Maps every watched file to the stages it invalidates.
+
+    The input files come from the stages themselves (see inputs.resolve_sources). Each settings
+    module invalidates the stage using it, except the main, cohorts and indexation settings which
+    are turned into the parameters of the simulation. The indexation only changes the exports.
+
+    returns:
+        (dict): the stages invalidated by each file, by absolute file path
+    """
+    return_value = {}
+
+    for name, paths in inputs.resolve_sources().items():
+        for path in paths:
+            return_value.setdefault(path, set()).add(name)
+
+    for name, module in inputs.RULES.items():
+        path = os.path.realpath(module.settings.__file__)
+        return_value.setdefault(path, set()).add(name)
+
+    return_value.setdefault(os.path.realpath(settings.__file__), set()).update(
+        runner.RULES
+    )
+    return_value.setdefault(os.path.realpath(cohorts_settings.__file__), set()).add(
+        "lab_budgets"
+    )
+    return_value.setdefault(os.path.realpath(indexation_settings.__file__), set())
+
+    return return_value
+
+
+def __get_settings_modules():
+    """
+    Returns the settings modules by absolute file path, so they can be reloaded when they change
+    """
+    return {
+        os.path.realpath(module.__file__): module
+        for module in [settings, cohorts_settings, indexation_settings]
+        + [module.settings for module in inputs.RULES.values()]
+    }
+
+
+def __get_modification_times(paths):
+    return_value = {}
+    for path in paths:
+        try:
+            return_value[path] = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            # the file is being saved, it will show up again at the next check
+            return_value[path] = None
+    return return_value
+
+
+def exported_rules(changed_files, rules):
+    """
+    Returns the rules whose monthly lines have to be dumped again after a change: the rules run
+    again, or all of them when the indexation settings changed.
+
+    parameters:
+        changed_files (list): the absolute paths of the changed files
+        rules (list): the rules run again
+
+    returns:
+        (list): the rules to export again
+    """
+    if os.path.realpath(indexation_settings.__file__) in changed_files:
+        return list(runner.RULES)
+    return rules
+
+
+def main(interval=1.0):
+    """
+    Runs the simulation, then watches the input files and the settings and runs again the
+    rules invalidated by every change, keeping the periods of the other rules.
+    The monthly lines of each rule are dumped to their own file (see main.export_rules), so that
+    a change only writes again the files of the rules it invalidates. The output file of the run
+    command (settings.OUTPUT_FILE) is removed when starting, as it gets out of date at the first
+    change.
+
+    parameters:
+        interval (float): the number of seconds between two checks of the files
+    """
+    logger.info("Started watching the inputs")
+
+    if os.path.exists(settings.OUTPUT_FILE):
+        logger.info(
+            "Removing {}, the monthly lines go to 1 file per rule".format(
+                settings.OUTPUT_FILE
+            )
+        )
+        os.remove(settings.OUTPUT_FILE)
+
+    params = runner.get_params()
+    loaded_inputs = inputs.load_all()
+    ledger = LedgerIndex()
+    runner.run_rules(params, loaded_inputs, ledger)
+    runner.export_rules(ledger, loaded_inputs, params.get("indexation"))
+
+    watched_files = __get_watched_files()
+    modification_times = __get_modification_times(watched_files.keys())
+    logger.info("Watching {} files".format(len(watched_files)))
+
+    while True:
+        time.sleep(interval)
+
+        current_times = __get_modification_times(watched_files.keys())
+        changed_files = [
+            path
+            for path, modification_time in current_times.items()
+            if modification_time is not None
+            and modification_time != modification_times[path]
+        ]
+        if not changed_files:
+            continue
+        modification_times.update({path: current_times[path] for path in changed_files})
+        logger.info("Changed files: {}".format(", ".join(changed_files)))
+
+        # The settings get reloaded in place, so the rules see the new values
+        settings_modules = __get_settings_modules()
+        params_files = [
+            os.path.realpath(settings.__file__),
+            os.path.realpath(cohorts_settings.__file__),
+            os.path.realpath(indexation_settings.__file__),
+        ]
+        stages = set()
+        stages_to_load = set()
+        for path in changed_files:
+            if path in settings_modules:
+                importlib.reload(settings_modules[path])
+            stages.update(watched_files[path])
+            if path not in params_files:
+                stages_to_load.update(watched_files[path])
+
+        try:
+            params = runner.get_params()
+
+            # A stage whose input files or settings changed has its inputs loaded again
+            if stages_to_load:
+                loaded_inputs.update(inputs.load_all(names=sorted(stages_to_load)))
+
+            rules = invalidated_rules(stages)
+            logger.info("Running again: {}".format(", ".join(rules) or "none"))
+            runner.run_rules(params, loaded_inputs, ledger, names=rules)
+            # only the files of the rules whose monthly lines changed are written again
+            runner.export_rules(
+                ledger,
+                loaded_inputs,
+                params.get("indexation"),
+                names=exported_rules(changed_files, rules),
+            )
+
+            # the settings may point to other files now
+            watched_files = __get_watched_files()
+            modification_times = dict(
+                __get_modification_times(watched_files.keys()), **modification_times
+            )
+        except Exception:
+            # keep watching, the next save will most likely fix it
+            logger.exception("Failed to run the invalidated rules")